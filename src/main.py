@@ -2,12 +2,48 @@
 MS-AUTH-PY - Microservicio de Autenticación
 FastAPI Application
 """
+import logging
+import sys
+
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from starlette.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, RedirectResponse
+from starlette.types import ASGIApp
 
 from .config import settings
+from .models import SessionLocal
 from .routers import auth_router, users_router
+from .utils import install_introspection_cache, setup_audit_logging, stop_audit_logging
+
+# Configurar logging una sola vez para toda la aplicación
+logging.basicConfig(
+    level=logging.DEBUG if settings.DEBUG else logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Evita recalcular inspect.iscoroutinefunction & co. por dependency en cada petición
+install_introspection_cache()
+
+# Auditoría: las requests solo encolan, un hilo en segundo plano escribe a stdout
+setup_audit_logging()
+
+
+class CachedCORSMiddleware(CORSMiddleware):
+    """
+    CORSMiddleware con las estructuras de consulta precalculadas
+
+    Starlette ya une las cabeceras de preflight una sola vez en __init__;
+    aquí se convierten orígenes, métodos y cabeceras permitidas a frozenset
+    para que las verificaciones por request sean O(1).
+    """
+
+    def __init__(self, app: ASGIApp, **kwargs):
+        super().__init__(app, **kwargs)
+        self.allow_origins = frozenset(self.allow_origins)
+        self.allow_headers = frozenset(self.allow_headers)
+        self.allow_methods = frozenset(self.allow_methods)
+
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -27,16 +63,23 @@ app = FastAPI(
     """,
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    # orjson serializa a bytes en una sola llamada en C (datetime nativo)
+    default_response_class=ORJSONResponse
 )
 
+# Fábrica de sesiones para el código que abre su propia sesión fuera de get_db
+# (usuario actual en un fallo de caché, background tasks); los tests la reemplazan
+app.state.SessionLocal = SessionLocal
+
 # Configurar CORS
 app.add_middleware(
-    CORSMiddleware,
+    CachedCORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After-Id"],
 )
 
 # Incluir routers
@@ -73,22 +116,31 @@ async def root_health():
 @app.on_event("startup")
 async def startup_event():
     """Evento de inicio de la aplicación"""
-    print(f"🚀 {settings.APP_NAME} v{settings.APP_VERSION} iniciado")
-    print(f"📚 Documentación disponible en: http://{settings.SERVICE_HOST}:{settings.SERVICE_PORT}/docs")
-    print(f"🔐 Endpoints de autenticación en: {settings.API_PREFIX}")
+    logger.info("%s v%s iniciado", settings.APP_NAME, settings.APP_VERSION)
+    logger.debug(
+        "Documentación disponible en: http://%s:%s/docs",
+        settings.SERVICE_HOST, settings.SERVICE_PORT
+    )
+    logger.debug("Endpoints de autenticación en: %s", settings.API_PREFIX)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Evento de cierre de la aplicación"""
-    print(f"🛑 {settings.APP_NAME} detenido")
+    logger.info("%s detenido", settings.APP_NAME)
+    stop_audit_logging()
+    
+    # Solo si algún email llegó a cargar el módulo (y abrir la conexión SMTP)
+    email_module = sys.modules.get(f"{__package__}.utils.email")
+    if email_module is not None:
+        await email_module.close_smtp_client()
 
 
 if __name__ == "__main__":
     import uvicorn
     
     uvicorn.run(
-        "main:app",
+        "src.main:app",
         host=settings.SERVICE_HOST,
         port=settings.SERVICE_PORT,
         reload=settings.DEBUG
@@ -1,8 +1,8 @@
 """
 Modelos de la base de datos
 """
-from .database import Base, get_db, engine
+from .database import Base, SessionLocal, get_db, engine, insert_ignoring_conflicts
 from .user import User, UserRole
 
-__all__ = ["Base", "get_db", "engine", "User", "UserRole"]
+__all__ = ["Base", "SessionLocal", "get_db", "engine", "insert_ignoring_conflicts", "User", "UserRole"]
 
@@ -1,36 +1,91 @@
 """
 Configuración de la base de datos
 """
-from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.sql.dml import Insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from ..config import settings
 
-# Crear engine de SQLAlchemy
-engine = create_engine(
-    settings.DATABASE_URL,
+# Driver asyncio equivalente a cada driver síncrono admitido en DATABASE_URL
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def _async_database_url(url: str) -> URL:
+    """
+    Convierte una URL de base de datos a su driver asyncio
+
+    Permite seguir usando DATABASE_URL=postgresql://... en la configuración.
+
+    Args:
+        url: URL de conexión (síncrona o asyncio)
+
+    Returns:
+        URL: URL con driver asyncio (asyncpg/aiosqlite)
+    """
+    parsed = make_url(url)
+    drivername = _ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername)
+
+
+# Constructor de INSERT con soporte de ON CONFLICT para cada dialecto admitido
+_CONFLICT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def insert_ignoring_conflicts(db: AsyncSession, model) -> Insert:
+    """
+    Construye INSERT ... ON CONFLICT DO NOTHING para el dialecto de la sesión
+
+    Si una restricción UNIQUE choca no se inserta nada (y RETURNING no
+    devuelve filas), en un solo round-trip y sin carrera entre SELECT e INSERT.
+
+    Args:
+        db: Sesión de base de datos (define el dialecto)
+        model: Modelo o tabla destino
+
+    Returns:
+        Insert: Sentencia INSERT lista para .values()/.returning()
+    """
+    return _CONFLICT_INSERTS[db.get_bind().dialect.name](model).on_conflict_do_nothing()
+
+
+# Crear engine asyncio de SQLAlchemy (único por proceso, con pool de conexiones)
+engine = create_async_engine(
+    _async_database_url(settings.DATABASE_URL),
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_size=settings.DATABASE_POOL_SIZE,
+    max_overflow=settings.DATABASE_MAX_OVERFLOW,
+    pool_recycle=settings.DATABASE_POOL_RECYCLE,
+    pool_timeout=settings.DATABASE_POOL_TIMEOUT
 )
 
-# Crear SessionLocal
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Crear SessionLocal (sin expirar en commit: evita cargas perezosas implícitas)
+SessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 # Base para modelos
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """
     Dependency para obtener sesión de base de datos
-    
+
     Yields:
-        Session: Sesión de SQLAlchemy
+        AsyncSession: Sesión asyncio de SQLAlchemy
     """
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
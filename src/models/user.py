@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum, Index, text
 from sqlalchemy.sql import func
 from .database import Base
 import enum
@@ -14,10 +14,28 @@ class UserRole(str, enum.Enum):
 class User(Base):
     
     __tablename__ = "users"
+    __table_args__ = (
+        # Índices cubrientes para buscar por código/token sin leer el heap
+        Index(
+            "ix_users_reset_token_active", "reset_token", "reset_token_expires",
+            postgresql_where=text("reset_token IS NOT NULL")
+        ),
+        Index(
+            "ix_users_reset_code_active", "reset_code", "reset_code_expires",
+            postgresql_where=text("reset_code IS NOT NULL")
+        ),
+        # Unicidad e índice para las búsquedas de email sin distinguir mayúsculas
+        Index("users_email_lower_idx", func.lower(text("email")), unique=True),
+        # Índices parciales para los filtros de list_users
+        Index("ix_users_role_active", "role", postgresql_where=text("is_active = true")),
+        Index("ix_users_inactive", "is_active", postgresql_where=text("is_active = false")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
-    email = Column(String(255), unique=True, nullable=False, index=True)
+    # Unicidad e índice: solo users_email_lower_idx (lower(email) también impide
+    # duplicados que solo difieren en mayúsculas)
+    email = Column(String(255), nullable=False)
     password_hash = Column(String(255), nullable=False)
     role = Column(Enum(UserRole), default=UserRole.ADMIN, nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
@@ -26,8 +44,8 @@ class User(Base):
     security_question = Column(String(255), nullable=True)  # Pregunta de seguridad
     security_answer_hash = Column(String(255), nullable=True)  # Respuesta hasheada
     # Campos para restablecimiento de contraseña
-    reset_token = Column(String(255), nullable=True, index=True)
-    reset_code = Column(String(6), nullable=True, index=True)  # Código de 6 dígitos para SMS
+    reset_token = Column(String(255), nullable=True)
+    reset_code = Column(String(6), nullable=True)  # Código de 6 dígitos para SMS
     reset_token_expires = Column(DateTime(timezone=True), nullable=True)
     reset_code_expires = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
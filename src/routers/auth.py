@@ -2,103 +2,306 @@
 Router de Autenticación
 Endpoints: /login, /me, /health
 """
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+import orjson
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import load_only, raiseload
+from sqlalchemy import bindparam, func, select, text, update
 
-from ..models import get_db, User
+from ..models import get_db, insert_ignoring_conflicts, User
 from ..schemas import (
-    Token, UserResponse, UserLogin, HealthResponse, UserCreate,
+    Token, UserResponse, build_user_response, UserLogin, HealthResponse, UserCreate,
     ForgotPasswordRequest, ResetPasswordRequest, ForgotPasswordResponse, PasswordResetResponse
 )
 from ..utils import (
-    verify_password, create_access_token, get_current_user, get_password_hash,
-    generate_reset_token, get_reset_token_expiration, is_reset_token_valid,
+    averify_password, verify_dummy_password, password_needs_rehash,
+    create_access_token, get_current_user, aget_password_hash,
+    ResetToken, new_reset_token, is_reset_token_valid,
     generate_reset_code, get_reset_code_expiration, is_reset_code_valid,
-    verify_security_answer
+    averify_security_answer, hash_security_answer, security_answer_needs_rehash,
+    run_password_hashing, secrets_match,
+    CurrentUser, oauth2_scheme, revoke_access_token, model_response
 )
-from ..utils.email import send_reset_password_email
 from ..config import settings
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Estado cacheado del ping a la base de datos (stale-while-revalidate con backoff):
+# "next" es el instante (monotonic) a partir del cual se vuelve a hacer ping
+_db_health = {"status": "unknown", "ts": 0.0, "next": 0.0, "failures": 0}
+_db_health_lock = asyncio.Lock()
+
+# Login: solo las columnas para autenticar y armar UserResponse (filas, sin entidad ORM)
+_LOGIN_STMT = select(
+    User.id, User.name, User.email, User.password_hash,
+    User.role, User.is_active, User.created_at
+).where(func.lower(User.email) == bindparam("email"))
+
+# Entidad por email para recuperación de contraseña; load_only se agrega por llamada
+_USER_BY_EMAIL_STMT = select(User).where(
+    func.lower(User.email) == bindparam("email")
+).options(raiseload("*"))
+
+# Cuerpos JSON constantes, serializados una sola vez al importar
+_LOGOUT_BODY = orjson.dumps({
+    "message": "Sesión cerrada exitosamente",
+    "detail": "Por favor elimine el token del cliente"
+})
+_HEALTH_OK_BODY = orjson.dumps({
+    "status": "healthy",
+    "service": settings.APP_NAME,
+    "version": settings.APP_VERSION,
+    "database": "connected"
+})
+
+# Tabla para normalizar teléfonos en una sola pasada (quita espacios, guiones y +)
+_PHONE_STRIP = str.maketrans("", "", " -+")
+
+
+async def _get_user_by_email(db: AsyncSession, email: str, *columns) -> Optional[User]:
+    """
+    Busca un usuario por email (sin distinguir mayúsculas)
+    
+    Las relaciones nunca se cargan de forma perezosa (raiseload), para que
+    ninguna consulta N+1 aparezca sin darnos cuenta si se agregan al modelo.
+    
+    Args:
+        db: Sesión de base de datos
+        email: Email a buscar
+        columns: Columnas a cargar (por defecto todas)
+        
+    Returns:
+        Optional[User]: Usuario encontrado o None
+    """
+    # lower(email) coincide con el índice funcional users_email_lower_idx
+    stmt = _USER_BY_EMAIL_STMT
+    if columns:
+        stmt = stmt.options(load_only(*columns, raiseload=True))
+    return (await db.execute(stmt, {"email": email.lower()})).scalar_one_or_none()
+
+
+async def _update_user(db: AsyncSession, user_id: int, **values) -> None:
+    """
+    Actualiza solo las columnas indicadas con un único UPDATE y hace commit
+    
+    No sincroniza objetos de la sesión: quien llama no vuelve a leerlos.
+    
+    Args:
+        db: Sesión de base de datos
+        user_id: ID del usuario
+        values: Columnas a actualizar
+    """
+    await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def _rehash_password(
+    session_factory: async_sessionmaker, user_id: int, password: str, old_hash: str
+) -> None:
+    """
+    Regenera el hash de una contraseña con los parámetros actuales
+    
+    Se ejecuta como background task después de un login exitoso, con una
+    sesión propia (la de la petición puede estar cerrada o con la transacción
+    del SELECT del login abierta). El UPDATE solo aplica si el hash no cambió
+    mientras tanto (ej: un reset en paralelo).
+    
+    Args:
+        session_factory: Fábrica de sesiones de la app (app.state.SessionLocal)
+        user_id: ID del usuario
+        password: Contraseña ya verificada
+        old_hash: Hash con el que se verificó
+    """
+    new_hash = await aget_password_hash(password)
+    async with session_factory() as db:
+        await db.execute(
+            update(User)
+            .where(User.id == user_id, User.password_hash == old_hash)
+            .values(password_hash=new_hash)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def _store_reset_code(db: AsyncSession, user_id: int, reset_code: str, expires: datetime) -> None:
+    """
+    Guarda un código de restablecimiento (invalida cualquier token largo previo)
+    """
+    await _update_user(
+        db, user_id,
+        reset_code=reset_code,
+        reset_code_expires=expires,
+        reset_token=None,
+        reset_token_expires=None
+    )
+
+
+async def _store_reset_token(
+    db: AsyncSession, user_id: int, reset_token: ResetToken, **values
+) -> None:
+    """
+    Guarda un token de restablecimiento (invalida cualquier código previo)
+    
+    values agrega otras columnas al mismo UPDATE.
+    """
+    await _update_user(
+        db, user_id,
+        reset_token=reset_token.token,
+        reset_token_expires=reset_token.expires,
+        reset_code=None,
+        reset_code_expires=None,
+        **values
+    )
+
+
+def _log_dev_reset_secret(email: str, label: str, value: str) -> None:
+    """
+    En desarrollo (DEBUG y SMTP deshabilitado) deja el código/token en el log
+    del servidor, ya que nunca se devuelve en la respuesta
+    
+    Requiere DEBUG=True y registra en nivel DEBUG: así un despliegue sin SMTP
+    nunca escribe credenciales de restablecimiento válidas en el log normal.
+    """
+    if settings.DEBUG and not settings.SMTP_ENABLED:
+        logger.debug("[DEV] %s de restablecimiento para %s: %s", label, email, value)
+
+
+async def _refresh_db_health(session_factory: async_sessionmaker, seen_ts: float) -> None:
+    """
+    Ejecuta el ping a la base de datos y actualiza el estado cacheado
+    
+    Los refrescos se serializan con un lock; quien lo obtiene después de que
+    otro refresco actualizó el estado no vuelve a hacer ping. Mientras la base
+    de datos falla, la espera hasta el siguiente ping se duplica en cada
+    intento (hasta HEALTH_DB_MAX_BACKOFF_SECONDS) para no sumar carga a una
+    BD caída.
+    
+    Abre su propia sesión: como background task no puede contar con que la
+    sesión de la petición siga abierta.
+    
+    Args:
+        session_factory: Fábrica de sesiones de la app (app.state.SessionLocal)
+        seen_ts: Valor de _db_health["ts"] que motivó el refresco
+    """
+    async with _db_health_lock:
+        # Otro refresco terminó mientras se esperaba el lock: su resultado sirve
+        if _db_health["ts"] != seen_ts:
+            return
+        try:
+            async with session_factory() as db:
+                await db.execute(text("SELECT 1"))
+            database_status = "connected"
+            failures = 0
+            delay = settings.HEALTH_DB_TTL_SECONDS
+        except Exception as e:
+            database_status = f"error: {str(e)}"
+            failures = _db_health["failures"] + 1
+            delay = min(
+                settings.HEALTH_DB_TTL_SECONDS * 2 ** failures,
+                settings.HEALTH_DB_MAX_BACKOFF_SECONDS
+            )
+        now = time.monotonic()
+        _db_health.update(status=database_status, ts=now, next=now + delay, failures=failures)
 
 
 @router.post(
     "/login",
-    response_model=Token,
+    # Sin response_model: la respuesta se arma con datos de la BD y no se revalida
+    response_model=None,
+    responses={200: {"model": Token}},
     summary="Iniciar sesión",
     description="Autentica un usuario y devuelve un token JWT válido por 24 horas",
     tags=["Autenticación"]
 )
 async def login(
+    request: Request,
     credentials: UserLogin,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     HU0: Como administrador, quiero iniciar sesión con mis credenciales
     
     Args:
+        request: Petición en curso (fábrica de sesiones en app.state)
         credentials: Email y contraseña del usuario
+        background_tasks: Tareas a ejecutar después de responder (rehash)
         db: Sesión de base de datos
         
     Returns:
-        Token: Token JWT con información del usuario
+        Response: Token JWT con información del usuario (JSON con el esquema Token)
         
     Raises:
         HTTPException: Si las credenciales son incorrectas
     """
-    # Buscar usuario por email
-    user = db.query(User).filter(User.email == credentials.email).first()
+    # Buscar usuario por email (fila con columnas mínimas, sin identity map)
+    user = (await db.execute(_LOGIN_STMT, {"email": credentials.email.lower()})).first()
     
     if not user:
+        # Mismo costo de hash que una contraseña incorrecta (evita enumeración por tiempo)
+        await run_password_hashing(verify_dummy_password, credentials.password)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verificar contraseña
-    if not verify_password(credentials.password, user.password_hash):
+    # Verificar que el usuario esté activo antes de gastar un hash
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Usuario inactivo. Contacte al administrador.",
+        )
+    
+    # Verificar contraseña (un acierto reciente evita encolar otro hash en el pool)
+    if not await averify_password(credentials.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verificar que el usuario esté activo
-    if not user.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Usuario inactivo. Contacte al administrador.",
+    # Migración perezosa: hashes con otro costo o sin pepper se regeneran tras responder
+    if password_needs_rehash(user.password_hash):
+        background_tasks.add_task(
+            _rehash_password, request.app.state.SessionLocal,
+            user.id, credentials.password, user.password_hash
         )
     
     # Crear token JWT
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email, "role": user.role},
-        expires_delta=access_token_expires
-    )
+    access_token = create_access_token(data={"sub": user.email, "role": user.role})
     
-    # Retornar token y información del usuario
-    return Token(
+    # Retornar token y información del usuario (serializado directo a bytes, sin jsonable_encoder)
+    return model_response(Token.model_construct(
         access_token=access_token,
         token_type="bearer",
-        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,  # En segundos
-        user=UserResponse.model_validate(user)
-    )
+        expires_in=settings.ACCESS_TOKEN_EXPIRE_SECONDS,
+        user=build_user_response(user)
+    ))
 
 
 @router.get(
     "/me",
-    response_model=UserResponse,
+    response_model=None,
+    responses={200: {"model": UserResponse}},
     summary="Obtener usuario actual",
     description="Devuelve la información del usuario autenticado",
     tags=["Autenticación"]
 )
 async def get_me(
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     Obtiene la información del usuario autenticado
@@ -107,46 +310,68 @@ async def get_me(
         current_user: Usuario actual (inyectado por dependency)
         
     Returns:
-        UserResponse: Información del usuario
+        Response: Información del usuario (JSON con el esquema UserResponse)
     """
-    return UserResponse.model_validate(current_user)
+    return model_response(build_user_response(current_user))
 
 
 @router.get(
     "/health",
-    response_model=HealthResponse,
+    response_model=None,
+    responses={200: {"model": HealthResponse}},
     summary="Health check",
     description="Verifica el estado del servicio y la conexión a base de datos",
     tags=["Health"]
 )
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(
+    request: Request,
+    background_tasks: BackgroundTasks
+):
     """
     Health check del microservicio
     
+    El estado de la base de datos se cachea durante unos segundos: si está
+    vencido se devuelve el último valor y el ping se refresca en segundo
+    plano con una sesión propia.
+    
     Args:
-        db: Sesión de base de datos
+        request: Petición en curso (fábrica de sesiones en app.state)
+        background_tasks: Tareas a ejecutar después de responder
         
     Returns:
-        HealthResponse: Estado del servicio
+        Response: Estado del servicio (JSON con el esquema HealthResponse)
     """
     # Verificar conexión a base de datos
-    try:
-        db.execute(text("SELECT 1"))
-        database_status = "connected"
-    except Exception as e:
-        database_status = f"error: {str(e)}"
-    
-    return HealthResponse(
-        status="healthy" if database_status == "connected" else "unhealthy",
-        service=settings.APP_NAME,
-        version=settings.APP_VERSION,
-        database=database_status
-    )
+    session_factory = request.app.state.SessionLocal
+    now = time.monotonic()
+    if _db_health["ts"] == 0.0:
+        # Primer chequeo del proceso: no hay valor previo que devolver, así que
+        # las peticiones concurrentes esperan al ping en curso
+        await _refresh_db_health(session_factory, 0.0)
+    elif now >= _db_health["next"]:
+        # Se reserva el siguiente ping antes de encolarlo: las peticiones que
+        # llegan antes de que corra la tarea no encolan otro refresco
+        _db_health["next"] = now + settings.HEALTH_DB_TTL_SECONDS
+        background_tasks.add_task(_refresh_db_health, session_factory, _db_health["ts"])
+    database_status = _db_health["status"]
+    
+    # Solo se serializa de nuevo cuando la base de datos reporta un error
+    if database_status == "connected":
+        body = _HEALTH_OK_BODY
+    else:
+        body = orjson.dumps({
+            "status": "unhealthy",
+            "service": settings.APP_NAME,
+            "version": settings.APP_VERSION,
+            "database": database_status
+        })
+    return Response(content=body, media_type="application/json")
 
 
 @router.post(
     "/register",
-    response_model=UserResponse,
+    response_model=None,
+    responses={201: {"model": UserResponse}},
     summary="Registrar nuevo usuario",
     description="Crea un nuevo usuario administrador (solo para desarrollo)",
     tags=["Autenticación"],
@@ -154,7 +379,7 @@ async def health_check(db: Session = Depends(get_db)):
 )
 async def register_user(
     user_data: UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     # current_user: User = Depends(get_current_active_admin)  # Descomentar en producción
 ):
     """
@@ -166,56 +391,68 @@ async def register_user(
         db: Sesión de base de datos
         
     Returns:
-        UserResponse: Usuario creado
+        Response: Usuario creado (JSON con el esquema UserResponse)
         
     Raises:
         HTTPException: Si el email ya existe
     """
-    # Verificar que el email no exista
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
-    if existing_user:
+    password_hash = await aget_password_hash(user_data.password)
+    
+    # Crear nuevo usuario: INSERT ... ON CONFLICT DO NOTHING RETURNING trae las
+    # columnas generadas (id, created_at) y resuelve los duplicados en el mismo round-trip
+    new_user = (await db.execute(
+        insert_ignoring_conflicts(db, User)
+        .values(
+            name=user_data.name,
+            email=user_data.email,
+            password_hash=password_hash,
+            role=user_data.role,
+            is_active=True
+        )
+        .returning(User)
+    )).scalar_one_or_none()
+    if new_user is None:
+        # La restricción UNIQUE de email es la verificación de duplicados
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El email ya está registrado"
         )
     
-    # Crear nuevo usuario
-    new_user = User(
-        name=user_data.name,
-        email=user_data.email,
-        password_hash=get_password_hash(user_data.password),
-        role=user_data.role,
-        is_active=True
-    )
-    
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    # Las columnas ya vienen del RETURNING: se serializa sin otro SELECT
+    user_response = build_user_response(new_user)
+    await db.commit()
     
-    return UserResponse.model_validate(new_user)
+    return model_response(user_response, status.HTTP_201_CREATED)
 
 
 @router.post(
     "/logout",
     summary="Cerrar sesión",
     description="Cierra la sesión del usuario (cliente debe eliminar el token)",
-    tags=["Autenticación"]
+    tags=["Autenticación"],
+    # Solo exige autenticación: el usuario no se usa en el handler
+    dependencies=[Depends(get_current_user)]
 )
-async def logout(current_user: User = Depends(get_current_user)):
+async def logout(token: str = Depends(oauth2_scheme)):
     """
     Cierra la sesión del usuario
-    Nota: Como usamos JWT stateless, el cliente debe eliminar el token
+    Nota: La revocación es best-effort y el cliente igual debe eliminar el token:
+    - Es por proceso: otras réplicas y el mismo proceso tras un reinicio siguen
+      aceptando el token hasta que expira.
+    - Se guarda en una caché de REVOKED_TOKENS_MAX_SIZE entradas; si se llena
+      antes de que el token expire, los tokens revocados más antiguos se
+      descartan y vuelven a ser válidos.
     
     Args:
-        current_user: Usuario actual
+        token: Token JWT del header Authorization
         
     Returns:
-        dict: Mensaje de confirmación
+        Response: Mensaje de confirmación (JSON)
     """
-    return {
-        "message": "Sesión cerrada exitosamente",
-        "detail": "Por favor elimine el token del cliente"
-    }
+    revoke_access_token(token)
+    
+    return Response(content=_LOGOUT_BODY, media_type="application/json")
 
 
 @router.post(
@@ -227,10 +464,18 @@ async def logout(current_user: User = Depends(get_current_user)):
 )
 async def forgot_password(
     request: ForgotPasswordRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
 ):
-    # Buscar usuario por email
-    user = db.query(User).filter(User.email == request.email).first()
+    # Import diferido: aiosmtplib y email.mime solo se cargan si se usan
+    from ..utils.email import send_reset_password_email
+    
+    # Buscar usuario por email (solo las columnas necesarias)
+    user = await _get_user_by_email(
+        db, request.email,
+        User.id, User.name, User.email, User.is_active, User.phone_number,
+        User.security_question, User.security_answer_hash
+    )
     
     # Por seguridad, siempre devolvemos el mismo mensaje si el email no existe
     if not user or not user.is_active:
@@ -247,30 +492,20 @@ async def forgot_password(
         reset_code = generate_reset_code()
         reset_code_expires = get_reset_code_expiration(minutes=10)
         
-        user.reset_code = reset_code
-        user.reset_code_expires = reset_code_expires
-        user.reset_token = None  # No usar token largo
-        user.reset_token_expires = None
-        db.commit()
+        await _store_reset_code(db, user.id, reset_code, reset_code_expires)
         
-        # Intentar enviar por email
-        email_sent = await send_reset_password_email(
+        # Enviar por email después de responder (no bloquea la petición)
+        background_tasks.add_task(
+            send_reset_password_email,
             to_email=user.email,
             reset_code=reset_code,
             user_name=user.name
         )
-        
-        if email_sent:
-            message = "Se ha enviado un código de 6 dígitos a tu correo electrónico. Revisa tu bandeja de entrada (y spam). El código es válido por 10 minutos."
-            code_to_show = None  # No mostrar código si se envió por email
-        else:
-            # Si no se pudo enviar (SMTP deshabilitado o error), mostrar en pantalla (solo para desarrollo)
-            message = f"⚠️ No se pudo enviar el email. Tu código de restablecimiento es: {reset_code} (válido por 10 minutos). Ingresa este código para restablecer tu contraseña."
-            code_to_show = reset_code
+        _log_dev_reset_secret(user.email, "Código", reset_code)
         
         return ForgotPasswordResponse(
-            message=message,
-            reset_code=code_to_show,  # Solo mostrar si el email falló
+            message="Se ha enviado un código de 6 dígitos a tu correo electrónico. Revisa tu bandeja de entrada (y spam). El código es válido por 10 minutos.",
+            reset_code=None,
             token=None,  # No usar tokens largos
             security_question=None
         )
@@ -287,27 +522,23 @@ async def forgot_password(
         # Verificar si el usuario tiene teléfono configurado
         if not user.phone_number:
             # Si no tiene teléfono, usar método simple
-            reset_token = generate_reset_token()
-            reset_token_expires = get_reset_token_expiration(hours=1)
+            reset_token = new_reset_token(hours=1)
             
-            user.reset_token = reset_token
-            user.reset_token_expires = reset_token_expires
-            user.reset_code = None
-            user.reset_code_expires = None
-            db.commit()
+            await _store_reset_token(db, user.id, reset_token)
             
             return ForgotPasswordResponse(
-                message=f"El usuario no tiene teléfono configurado. Token de restablecimiento generado. Token: {reset_token} (válido por 1 hora).",
+                message=f"El usuario no tiene teléfono configurado. Token de restablecimiento generado. Token: {reset_token.token} (válido por 1 hora).",
                 reset_code=None,
-                token=reset_token,
+                token=reset_token.token,
                 security_question=None
             )
         
         # Verificar que el teléfono coincida (normalizar formato)
-        user_phone = user.phone_number.replace(" ", "").replace("-", "").replace("+", "") if user.phone_number else ""
-        request_phone = request.phone_number.replace(" ", "").replace("-", "").replace("+", "")
+        user_phone = (user.phone_number or "").translate(_PHONE_STRIP)
+        request_phone = request.phone_number.translate(_PHONE_STRIP)
         
-        if user_phone != request_phone:
+        # Comparación en tiempo constante para no filtrar prefijos por timing
+        if not secrets_match(user_phone, request_phone):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="El número de teléfono no coincide con el registrado"
@@ -317,31 +548,21 @@ async def forgot_password(
         reset_code = generate_reset_code()
         reset_code_expires = get_reset_code_expiration(minutes=10)  # Válido por 10 minutos
         
-        # Guardar código en la base de datos
-        user.reset_code = reset_code
-        user.reset_code_expires = reset_code_expires
-        user.reset_token = None  # Limpiar token anterior si existe
-        user.reset_token_expires = None
-        db.commit()
+        # Guardar código en la base de datos (limpia token anterior si existe)
+        await _store_reset_code(db, user.id, reset_code, reset_code_expires)
         
-        # Intentar enviar por email (más común que SMS)
-        email_sent = await send_reset_password_email(
+        # Enviar por email (más común que SMS) después de responder
+        background_tasks.add_task(
+            send_reset_password_email,
             to_email=user.email,
             reset_code=reset_code,
             user_name=user.name
         )
-        
-        if email_sent:
-            message = f"Se ha enviado un código de verificación a tu email ({user.email}). Revisa tu bandeja de entrada (y spam). El código es válido por 10 minutos."
-            code_to_show = None  # No mostrar código si se envió por email
-        else:
-            # Si no se pudo enviar (SMTP deshabilitado), mostrar en pantalla
-            message = f"Código de verificación generado. Código: {reset_code} (válido por 10 minutos). En producción, este código se enviaría por email."
-            code_to_show = reset_code
+        _log_dev_reset_secret(user.email, "Código", reset_code)
         
         return ForgotPasswordResponse(
-            message=message,
-            reset_code=code_to_show,
+            message=f"Se ha enviado un código de verificación a tu email ({user.email}). Revisa tu bandeja de entrada (y spam). El código es válido por 10 minutos.",
+            reset_code=None,
             token=None,
             security_question=None
         )
@@ -350,19 +571,14 @@ async def forgot_password(
         # Verificación por pregunta de seguridad
         if not user.security_question:
             # Si no tiene pregunta, usar método simple
-            reset_token = generate_reset_token()
-            reset_token_expires = get_reset_token_expiration(hours=1)
+            reset_token = new_reset_token(hours=1)
             
-            user.reset_token = reset_token
-            user.reset_token_expires = reset_token_expires
-            user.reset_code = None
-            user.reset_code_expires = None
-            db.commit()
+            await _store_reset_token(db, user.id, reset_token)
             
             return ForgotPasswordResponse(
-                message=f"El usuario no tiene pregunta de seguridad configurada. Token de restablecimiento generado. Token: {reset_token} (válido por 1 hora).",
+                message=f"El usuario no tiene pregunta de seguridad configurada. Token de restablecimiento generado. Token: {reset_token.token} (válido por 1 hora).",
                 reset_code=None,
-                token=reset_token,
+                token=reset_token.token,
                 security_question=None
             )
         
@@ -376,40 +592,37 @@ async def forgot_password(
             )
         
         # Verificar respuesta de seguridad
-        if not user.security_answer_hash or not verify_security_answer(request.security_answer, user.security_answer_hash):
+        if not user.security_answer_hash or not await averify_security_answer(
+            request.security_answer, user.security_answer_hash, user.id
+        ):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="La respuesta a la pregunta de seguridad es incorrecta"
             )
         
+        # Migración perezosa: una respuesta bcrypt antigua pasa a HMAC en el mismo UPDATE
+        migrated = {}
+        if security_answer_needs_rehash(user.security_answer_hash):
+            migrated["security_answer_hash"] = hash_security_answer(request.security_answer, user.id)
+        
         # Generar token de restablecimiento (fallback, no hay SMS)
-        reset_token = generate_reset_token()
-        reset_token_expires = get_reset_token_expiration(hours=1)
+        reset_token = new_reset_token(hours=1)
         
-        user.reset_token = reset_token
-        user.reset_token_expires = reset_token_expires
-        user.reset_code = None
-        user.reset_code_expires = None
-        db.commit()
+        await _store_reset_token(db, user.id, reset_token, **migrated)
         
-        # Intentar enviar por email
-        email_sent = await send_reset_password_email(
+        # Enviar por email después de responder
+        background_tasks.add_task(
+            send_reset_password_email,
             to_email=user.email,
-            reset_token=reset_token,
+            reset_token=reset_token.token,
             user_name=user.name
         )
-        
-        if email_sent:
-            message = "Verificación exitosa. Se ha enviado un email con el token de restablecimiento. Revisa tu bandeja de entrada (y spam). El token es válido por 1 hora."
-            token_to_show = None
-        else:
-            message = "Verificación exitosa. Token de restablecimiento generado. Copie el token y úselo para restablecer su contraseña. El token es válido por 1 hora."
-            token_to_show = reset_token
+        _log_dev_reset_secret(user.email, "Token", reset_token.token)
         
         return ForgotPasswordResponse(
-            message=message,
+            message="Verificación exitosa. Se ha enviado un email con el token de restablecimiento. Revisa tu bandeja de entrada (y spam). El token es válido por 1 hora.",
             reset_code=None,
-            token=token_to_show,
+            token=None,
             security_question=None
         )
     
@@ -429,7 +642,7 @@ async def forgot_password(
 )
 async def reset_password(
     request: ResetPasswordRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Restablece la contraseña usando código de 6 dígitos (SMS) o token
@@ -444,8 +657,12 @@ async def reset_password(
     Raises:
         HTTPException: Si el código/token es inválido o ha expirado
     """
-    # Buscar usuario por email
-    user = db.query(User).filter(User.email == request.email).first()
+    # Buscar usuario por email (solo las columnas que se verifican)
+    user = await _get_user_by_email(
+        db, request.email,
+        User.id, User.is_active, User.reset_code, User.reset_code_expires,
+        User.reset_token, User.reset_token_expires
+    )
     
     if not user:
         raise HTTPException(
@@ -463,7 +680,7 @@ async def reset_password(
     # Verificar código o token
     if request.reset_code:
         # Verificación por código de 6 dígitos (SMS)
-        if user.reset_code != request.reset_code:
+        if not secrets_match(user.reset_code, request.reset_code):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Código de verificación inválido"
@@ -472,22 +689,16 @@ async def reset_password(
         # Verificar que el código no haya expirado
         if not is_reset_code_valid(user.reset_code_expires):
             # Limpiar código expirado
-            user.reset_code = None
-            user.reset_code_expires = None
-            db.commit()
+            await _update_user(db, user.id, reset_code=None, reset_code_expires=None)
             
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="El código de verificación ha expirado. Por favor solicite uno nuevo."
             )
         
-        # Limpiar código después de usar
-        user.reset_code = None
-        user.reset_code_expires = None
-        
     elif request.token:
         # Verificación por token (fallback)
-        if user.reset_token != request.token:
+        if not secrets_match(user.reset_token, request.token):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Token de restablecimiento inválido"
@@ -496,28 +707,28 @@ async def reset_password(
         # Verificar que el token no haya expirado
         if not is_reset_token_valid(user.reset_token_expires):
             # Limpiar token expirado
-            user.reset_token = None
-            user.reset_token_expires = None
-            db.commit()
+            await _update_user(db, user.id, reset_token=None, reset_token_expires=None)
             
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="El token de restablecimiento ha expirado. Por favor solicite uno nuevo."
             )
         
-        # Limpiar token después de usar
-        user.reset_token = None
-        user.reset_token_expires = None
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Se requiere código de verificación o token"
         )
     
-    # Actualizar contraseña
-    user.password_hash = get_password_hash(request.new_password)
-    
-    db.commit()
+    # Actualizar contraseña y consumir código/token en un solo UPDATE
+    await _update_user(
+        db, user.id,
+        password_hash=await aget_password_hash(request.new_password),
+        reset_code=None,
+        reset_code_expires=None,
+        reset_token=None,
+        reset_token_expires=None
+    )
     
     return PasswordResetResponse(
         message="Contraseña restablecida exitosamente. Ya puede iniciar sesión con su nueva contraseña.",
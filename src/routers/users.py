@@ -4,21 +4,91 @@ Endpoints: /users (CRUD completo)
 """
 import secrets
 import string
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
-from datetime import datetime
 
-from ..models import get_db, User, UserRole
+from ..models import User, UserRole, insert_ignoring_conflicts
 from ..schemas import (
-    UserCreate, UserUpdate, UserResponse, UserListResponse, 
-    PasswordResetResponse, RolesResponse, HealthResponse
+    UserCreate, UserUpdate, UserResponse, build_user_response, UserListResponse, 
+    PasswordResetResponse, RolesResponse, RoleInfo, HealthResponse
+)
+from ..utils import (
+    AuthContext, get_auth_context, aget_password_hash,
+    invalidate_current_user_cache, audit_event, model_response
 )
-from ..utils import get_current_user, get_password_hash, verify_password
 from ..config import settings
 
 router = APIRouter()
 
+# Bit de cada clase de carácter exigida (ISO 27001) y mensaje si falta, en orden de validación
+_PASSWORD_CLASSES = (
+    (1, "La contraseña debe contener al menos una mayúscula"),
+    (2, "La contraseña debe contener al menos una minúscula"),
+    (4, "La contraseña debe contener al menos un número"),
+)
+_PASSWORD_ALL_CLASSES = 7
+
+# Roles válidos: conjunto y mensaje construidos una sola vez al importar
+_VALID_ROLES: frozenset = frozenset(role.value for role in UserRole)
+_VALID_ROLES_STR = ", ".join(role.value for role in UserRole)
+
+# Roles disponibles: respuesta constante serializada una sola vez al importar
+_ROLES_BODY = orjson.dumps(RolesResponse(
+    roles=[
+        RoleInfo(value="ADMIN", label="Administrador", description="Acceso completo al sistema"),
+        RoleInfo(value="TENDERO", label="Tendero", description="Gestión de tiendas y establecimientos"),
+        RoleInfo(value="VENDEDOR", label="Vendedor", description="Gestión de ventas y clientes")
+    ]
+).model_dump())
+
+# Consulta de lectura por ID: solo las columnas de UserResponse (filas, sin entidad ORM)
+_USER_BY_ID_STMT = select(
+    User.id, User.name, User.email, User.role, User.is_active, User.created_at
+).where(User.id == bindparam("user_id"))
+
+# Consulta base del listado: solo las columnas de UserListResponse
+_USER_LIST_STMT = select(
+    User.id, User.name, User.email, User.role, User.is_active, User.created_at
+)
+
+
+def _password_policy_error(password: str) -> Optional[str]:
+    """
+    Valida la política de contraseñas recorriendo la cadena una sola vez
+    
+    Cada carácter marca el bit de su clase; se corta en cuanto están todas.
+    
+    Args:
+        password: Contraseña en texto plano
+        
+    Returns:
+        Optional[str]: Mensaje del primer requisito incumplido o None si es válida
+    """
+    if len(password) < 8:
+        return "La contraseña debe tener al menos 8 caracteres"
+    
+    mask = 0
+    for c in password:
+        if c.isupper():
+            mask |= 1
+        elif c.islower():
+            mask |= 2
+        elif c.isdigit():
+            mask |= 4
+        else:
+            continue
+        if mask == _PASSWORD_ALL_CLASSES:
+            return None
+    
+    for bit, message in _PASSWORD_CLASSES:
+        if not mask & bit:
+            return message
+    return None
+
 
 def generate_temporary_password() -> str:
     """
@@ -30,32 +100,29 @@ def generate_temporary_password() -> str:
     - Al menos 1 carácter especial
     """
     length = 12
-    uppercase = string.ascii_uppercase
-    lowercase = string.ascii_lowercase
-    digits = string.digits
     special = "!@#$%^&*"
     
-    # Asegurar al menos un carácter de cada tipo
-    password = [
-        secrets.choice(uppercase),
-        secrets.choice(lowercase),
-        secrets.choice(digits),
-        secrets.choice(special)
-    ]
+    # Base aleatoria en una sola llamada: 9 bytes -> 12 caracteres URL-safe
+    password = bytearray(secrets.token_urlsafe(9).encode("ascii"))
     
-    # Completar con caracteres aleatorios
-    all_chars = uppercase + lowercase + digits + special
-    for _ in range(length - 4):
-        password.append(secrets.choice(all_chars))
+    # Asegurar al menos un carácter de cada tipo en posiciones aleatorias distintas
+    required = (
+        secrets.choice(string.ascii_uppercase),
+        secrets.choice(string.ascii_lowercase),
+        secrets.choice(string.digits),
+        secrets.choice(special)
+    )
+    positions = secrets.SystemRandom().sample(range(length), len(required))
+    for position, char in zip(positions, required):
+        password[position] = ord(char)
     
-    # Mezclar la contraseña
-    secrets.SystemRandom().shuffle(password)
-    return ''.join(password)
+    return password.decode("ascii")
 
 
 @router.get(
     "/users/roles",
-    response_model=RolesResponse,
+    response_model=None,
+    responses={200: {"model": RolesResponse}},
     summary="Obtener roles disponibles",
     description="Obtiene la lista de roles disponibles en el sistema",
     tags=["Gestión de Usuarios"]
@@ -65,22 +132,15 @@ async def get_available_roles():
     Obtiene la lista de roles disponibles
     
     Returns:
-        RolesResponse: Lista de roles con sus descripciones
+        Response: Lista de roles con sus descripciones (JSON con el esquema RolesResponse)
     """
-    from ..schemas import RoleInfo
-    
-    return RolesResponse(
-        roles=[
-            RoleInfo(value="ADMIN", label="Administrador", description="Acceso completo al sistema"),
-            RoleInfo(value="TENDERO", label="Tendero", description="Gestión de tiendas y establecimientos"),
-            RoleInfo(value="VENDEDOR", label="Vendedor", description="Gestión de ventas y clientes")
-        ]
-    )
+    return Response(content=_ROLES_BODY, media_type="application/json")
 
 
 @router.get(
     "/users",
-    response_model=List[UserListResponse],
+    response_model=None,
+    responses={200: {"model": List[UserListResponse]}},
     summary="Listar usuarios",
     description="Obtiene la lista de todos los usuarios del sistema",
     tags=["Gestión de Usuarios"]
@@ -88,10 +148,10 @@ async def get_available_roles():
 async def list_users(
     is_active: Optional[bool] = Query(None, description="Filtrar por estado activo"),
     role: Optional[str] = Query(None, description="Filtrar por rol"),
-    skip: int = Query(0, ge=0, description="Número de registros a omitir"),
+    skip: int = Query(0, ge=0, description="Número de registros a omitir (preferir after_id)"),
+    after_id: Optional[int] = Query(None, ge=0, description="Devolver usuarios con ID mayor a este (paginación por cursor)"),
     limit: int = Query(100, ge=1, le=100, description="Número máximo de registros"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    ctx: AuthContext = Depends(get_auth_context)
 ):
     """
     Lista todos los usuarios del sistema con filtros opcionales
@@ -99,32 +159,57 @@ async def list_users(
     Args:
         is_active: Filtrar por estado activo/inactivo
         role: Filtrar por rol específico
-        skip: Número de registros a omitir (paginación)
+        skip: Número de registros a omitir (paginación por OFFSET, se mantiene por compatibilidad)
+        after_id: Último ID de la página anterior (paginación por cursor)
         limit: Número máximo de registros a retornar
-        db: Sesión de base de datos
-        current_user: Usuario autenticado
+        ctx: Sesión de base de datos y usuario autenticado
         
     Returns:
-        List[UserListResponse]: Lista de usuarios
+        List[UserListResponse]: Lista de usuarios ordenada por ID; la cabecera
+        X-Next-After-Id trae el cursor de la página siguiente si la hay
     """
-    query = db.query(User)
+    query = _USER_LIST_STMT
     
     # Aplicar filtros
     if is_active is not None:
-        query = query.filter(User.is_active == is_active)
+        query = query.where(User.is_active == is_active)
     
     if role:
-        query = query.filter(User.role == role)
-    
-    # Aplicar paginación
-    users = query.offset(skip).limit(limit).all()
-    
-    return users
+        query = query.where(User.role == role)
+    
+    # Paginación por cursor: búsqueda en el índice de la PK en lugar de recorrer OFFSET filas
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+    if skip:
+        query = query.offset(skip)
+    
+    # Una sola consulta de columnas, sin entidades ORM
+    rows = (await ctx.db.execute(query.order_by(User.id).limit(limit))).all()
+    
+    # Las filas ya cumplen UserListResponse: se serializan sin revalidar
+    users = []
+    for row in rows:
+        item = {
+            "id": row.id,
+            "name": row.name,
+            "email": row.email,
+            "role": getattr(row.role, "value", row.role),
+            "is_active": row.is_active,
+        }
+        if row.created_at is not None:
+            item["created_at"] = row.created_at
+        users.append(item)
+    
+    response = ORJSONResponse(users)
+    if len(rows) == limit:
+        response.headers["X-Next-After-Id"] = str(rows[-1].id)
+    return response
 
 
 @router.post(
     "/users",
-    response_model=UserResponse,
+    response_model=None,
+    responses={201: {"model": UserResponse}},
     summary="Crear usuario",
     description="Crea un nuevo usuario en el sistema con contraseña temporal",
     tags=["Gestión de Usuarios"],
@@ -132,138 +217,123 @@ async def list_users(
 )
 async def create_user(
     user_data: UserCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    ctx: AuthContext = Depends(get_auth_context)
 ):
     """
     Crea un nuevo usuario en el sistema
     
     Args:
         user_data: Datos del nuevo usuario
-        db: Sesión de base de datos
-        current_user: Usuario autenticado
+        ctx: Sesión de base de datos y usuario autenticado
         
     Returns:
-        UserResponse: Usuario creado
+        Response: Usuario creado (JSON con el esquema UserResponse)
         
     Raises:
         HTTPException: Si el email ya existe o datos inválidos
     """
     # Validar rol
-    valid_roles = [role.value for role in UserRole]
-    if user_data.role not in valid_roles:
+    if user_data.role not in _VALID_ROLES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Rol inválido. Roles válidos: {', '.join(valid_roles)}"
+            detail=f"Rol inválido. Roles válidos: {_VALID_ROLES_STR}"
         )
     
-    # Verificar que el email no exista
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El email ya está registrado en el sistema"
-        )
-    
-    # Debug: Imprimir datos recibidos
-    print(f"[DEBUG] Datos recibidos: {user_data.model_dump()}")
-    print(f"[DEBUG] Contraseña proporcionada: {'SÍ' if user_data.password else 'NO'}")
-    
     # Usar contraseña manual si se proporciona, o generar una automática
     if user_data.password:
-        print(f"[DEBUG] Usando contraseña manual: {user_data.password[:3]}...")
         # Validar seguridad de contraseña manual (ISO 27001)
-        if len(user_data.password) < 8:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="La contraseña debe tener al menos 8 caracteres"
-            )
-        if not any(c.isupper() for c in user_data.password):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="La contraseña debe contener al menos una mayúscula"
-            )
-        if not any(c.islower() for c in user_data.password):
+        policy_error = _password_policy_error(user_data.password)
+        if policy_error:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="La contraseña debe contener al menos una minúscula"
-            )
-        if not any(c.isdigit() for c in user_data.password):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="La contraseña debe contener al menos un número"
+                detail=policy_error
             )
         user_password = user_data.password
     else:
         # Generar contraseña temporal automática
         user_password = generate_temporary_password()
-        print(f"[AUDIT] {datetime.now()}: Se generó contraseña automática para {user_data.email}")
-    
-    # Crear nuevo usuario
-    new_user = User(
-        name=user_data.name,
-        email=user_data.email,
-        password_hash=get_password_hash(user_password),
-        role=UserRole(user_data.role),
-        is_active=True
-    )
     
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    password_hash = await aget_password_hash(user_password)
+    
+    # Crear nuevo usuario: la restricción UNIQUE de email descarta duplicados en el
+    # mismo INSERT (sin SELECT previo ni carrera entre verificación e inserción)
+    new_user = (await ctx.db.execute(
+        insert_ignoring_conflicts(ctx.db, User)
+        .values(
+            name=user_data.name,
+            email=user_data.email,
+            password_hash=password_hash,
+            role=UserRole(user_data.role),
+            is_active=True
+        )
+        .returning(User)
+    )).scalar_one_or_none()
+    if new_user is None:
+        await ctx.db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El email ya está registrado en el sistema"
+        )
+    await ctx.db.commit()
     
-    # Log de auditoría (en producción usar un sistema de logging)
-    print(f"[AUDIT] {datetime.now()}: Usuario {current_user.email} creó usuario {new_user.email} con rol {new_user.role}")
+    if not user_data.password:
+        audit_event("temporary_password_generated", "Se generó contraseña automática para %s", new_user.email)
+    
+    # Log de auditoría
+    audit_event(
+        "user_created", "Usuario %s creó usuario %s con rol %s",
+        ctx.user.email, new_user.email, new_user.role.value
+    )
     
     # Preparar respuesta
-    user_response = UserResponse.model_validate(new_user)
+    user_response = build_user_response(new_user)
     
-    # Si se generó contraseña automática, incluirla en la respuesta
+    # Si se generó contraseña automática, incluirla en la respuesta (el schema es inmutable)
     if not user_data.password:
-        user_response.temporary_password = user_password
+        user_response = user_response.model_copy(update={"temporary_password": user_password})
     
-    return user_response
+    return model_response(user_response, status.HTTP_201_CREATED)
 
 
 @router.get(
     "/users/{user_id}",
-    response_model=UserResponse,
+    response_model=None,
+    responses={200: {"model": UserResponse}},
     summary="Obtener usuario",
     description="Obtiene la información de un usuario específico",
     tags=["Gestión de Usuarios"]
 )
 async def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    ctx: AuthContext = Depends(get_auth_context)
 ):
     """
     Obtiene la información de un usuario específico
     
     Args:
         user_id: ID del usuario
-        db: Sesión de base de datos
-        current_user: Usuario autenticado
+        ctx: Sesión de base de datos y usuario autenticado
         
     Returns:
-        UserResponse: Información del usuario
+        Response: Información del usuario (JSON con el esquema UserResponse)
         
     Raises:
         HTTPException: Si el usuario no existe
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = (await ctx.db.execute(_USER_BY_ID_STMT, {"user_id": user_id})).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Usuario no encontrado"
         )
     
-    return UserResponse.model_validate(user)
+    return model_response(build_user_response(user))
 
 
 @router.put(
     "/users/{user_id}",
-    response_model=UserResponse,
+    response_model=None,
+    responses={200: {"model": UserResponse}},
     summary="Actualizar usuario",
     description="Actualiza la información de un usuario existente",
     tags=["Gestión de Usuarios"]
@@ -271,8 +341,7 @@ async def get_user(
 async def update_user(
     user_id: int,
     user_data: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    ctx: AuthContext = Depends(get_auth_context)
 ):
     """
     Actualiza la información de un usuario
@@ -280,83 +349,86 @@ async def update_user(
     Args:
         user_id: ID del usuario a actualizar
         user_data: Datos a actualizar
-        db: Sesión de base de datos
-        current_user: Usuario autenticado
+        ctx: Sesión de base de datos y usuario autenticado
         
     Returns:
-        UserResponse: Usuario actualizado
+        Response: Usuario actualizado (JSON con el esquema UserResponse)
         
     Raises:
         HTTPException: Si el usuario no existe o email duplicado
     """
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Usuario no encontrado"
-        )
+    patch = user_data.model_dump(exclude_unset=True, exclude_none=True)
     
     # Validar rol si se proporciona
-    if user_data.role:
-        valid_roles = [role.value for role in UserRole]
-        if user_data.role not in valid_roles:
+    if "role" in patch:
+        if patch["role"] not in _VALID_ROLES:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Rol inválido. Roles válidos: {', '.join(valid_roles)}"
+                detail=f"Rol inválido. Roles válidos: {_VALID_ROLES_STR}"
             )
+        patch["role"] = UserRole(patch["role"])
     
-    # Verificar email único si se cambia
-    if user_data.email and user_data.email != user.email:
-        existing_user = db.query(User).filter(User.email == user_data.email).first()
-        if existing_user:
+    if not patch:
+        # Nada que actualizar: solo se devuelve el usuario actual
+        user = (await ctx.db.execute(_USER_BY_ID_STMT, {"user_id": user_id})).first()
+    else:
+        # Un solo UPDATE ... RETURNING; el índice UNIQUE de email detecta duplicados
+        try:
+            user = (await ctx.db.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(**patch)
+                .returning(*_USER_BY_ID_STMT.selected_columns)
+            )).first()
+        except IntegrityError:
+            await ctx.db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="El email ya está en uso por otro usuario"
             )
+        await ctx.db.commit()
     
-    # Actualizar campos
-    for field, value in user_data.model_dump(exclude_unset=True).items():
-        if field == "role" and value:
-            setattr(user, field, UserRole(value))
-        else:
-            setattr(user, field, value)
-    
-    db.commit()
-    db.refresh(user)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Usuario no encontrado"
+        )
     
-    # Log de auditoría
-    print(f"[AUDIT] {datetime.now()}: Usuario {current_user.email} actualizó usuario {user.email}")
+    if patch:
+        invalidate_current_user_cache()
+        
+        # Log de auditoría
+        audit_event("user_updated", "Usuario %s actualizó usuario %s", ctx.user.email, user.email)
     
-    return UserResponse.model_validate(user)
+    return model_response(build_user_response(user))
 
 
 @router.patch(
     "/users/{user_id}/toggle-status",
-    response_model=UserResponse,
+    response_model=None,
+    responses={200: {"model": UserResponse}},
     summary="Activar/Desactivar usuario",
     description="Cambia el estado activo/inactivo de un usuario",
     tags=["Gestión de Usuarios"]
 )
 async def toggle_user_status(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    ctx: AuthContext = Depends(get_auth_context)
 ):
     """
     Cambia el estado activo/inactivo de un usuario
     
     Args:
         user_id: ID del usuario
-        db: Sesión de base de datos
-        current_user: Usuario autenticado
+        ctx: Sesión de base de datos y usuario autenticado
         
     Returns:
-        UserResponse: Usuario con estado actualizado
+        Response: Usuario con estado actualizado (JSON con el esquema UserResponse)
         
     Raises:
         HTTPException: Si el usuario no existe
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await ctx.db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -365,14 +437,15 @@ async def toggle_user_status(
     
     # Cambiar estado
     user.is_active = not user.is_active
-    db.commit()
-    db.refresh(user)
+    await ctx.db.commit()
+    await ctx.db.refresh(user)
+    invalidate_current_user_cache()
     
     # Log de auditoría
     action = "activó" if user.is_active else "desactivó"
-    print(f"[AUDIT] {datetime.now()}: Usuario {current_user.email} {action} usuario {user.email}")
+    audit_event("user_status_changed", "Usuario %s %s usuario %s", ctx.user.email, action, user.email)
     
-    return UserResponse.model_validate(user)
+    return model_response(build_user_response(user))
 
 
 @router.post(
@@ -384,16 +457,14 @@ async def toggle_user_status(
 )
 async def reset_user_password(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    ctx: AuthContext = Depends(get_auth_context)
 ):
     """
     Genera una nueva contraseña temporal para un usuario
     
     Args:
         user_id: ID del usuario
-        db: Sesión de base de datos
-        current_user: Usuario autenticado
+        ctx: Sesión de base de datos y usuario autenticado
         
     Returns:
         PasswordResetResponse: Contraseña temporal generada
@@ -401,7 +472,7 @@ async def reset_user_password(
     Raises:
         HTTPException: Si el usuario no existe
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await ctx.db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -410,12 +481,12 @@ async def reset_user_password(
     
     # Generar nueva contraseña temporal
     temp_password = generate_temporary_password()
-    user.password_hash = get_password_hash(temp_password)
+    user.password_hash = await aget_password_hash(temp_password)
     
-    db.commit()
+    await ctx.db.commit()
     
     # Log de auditoría
-    print(f"[AUDIT] {datetime.now()}: Usuario {current_user.email} restableció contraseña de {user.email}")
+    audit_event("user_password_reset", "Usuario %s restableció contraseña de %s", ctx.user.email, user.email)
     
     return PasswordResetResponse(
         message="Nueva contraseña generada exitosamente",
@@ -425,7 +496,8 @@ async def reset_user_password(
 
 @router.patch(
     "/users/{user_id}/password",
-    response_model=UserResponse,
+    response_model=None,
+    responses={200: {"model": UserResponse}},
     summary="Actualizar contraseña",
     description="Actualiza la contraseña de un usuario con una contraseña manual",
     tags=["Gestión de Usuarios"]
@@ -433,8 +505,7 @@ async def reset_user_password(
 async def update_user_password(
     user_id: int,
     password_data: dict,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    ctx: AuthContext = Depends(get_auth_context)
 ):
     """
     Actualiza la contraseña de un usuario
@@ -442,16 +513,15 @@ async def update_user_password(
     Args:
         user_id: ID del usuario
         password_data: Datos con la nueva contraseña
-        db: Sesión de base de datos
-        current_user: Usuario autenticado
+        ctx: Sesión de base de datos y usuario autenticado
         
     Returns:
-        UserResponse: Usuario actualizado
+        Response: Usuario actualizado (JSON con el esquema UserResponse)
         
     Raises:
         HTTPException: Si el usuario no existe o la contraseña es inválida
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await ctx.db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -466,33 +536,19 @@ async def update_user_password(
         )
     
     # Validar seguridad de contraseña (ISO 27001)
-    if len(new_password) < 8:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="La contraseña debe tener al menos 8 caracteres"
-        )
-    if not any(c.isupper() for c in new_password):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="La contraseña debe contener al menos una mayúscula"
-        )
-    if not any(c.islower() for c in new_password):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="La contraseña debe contener al menos una minúscula"
-        )
-    if not any(c.isdigit() for c in new_password):
+    policy_error = _password_policy_error(new_password)
+    if policy_error:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="La contraseña debe contener al menos un número"
+            detail=policy_error
         )
     
     # Actualizar contraseña
-    user.password_hash = get_password_hash(new_password)
-    db.commit()
-    db.refresh(user)
+    user.password_hash = await aget_password_hash(new_password)
+    await ctx.db.commit()
+    await ctx.db.refresh(user)
     
     # Log de auditoría
-    print(f"[AUDIT] {datetime.now()}: Usuario {current_user.email} actualizó contraseña de {user.email}")
+    audit_event("user_password_updated", "Usuario %s actualizó contraseña de %s", ctx.user.email, user.email)
     
-    return UserResponse.model_validate(user)
+    return model_response(build_user_response(user))
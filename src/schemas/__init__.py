@@ -6,6 +6,7 @@ from .auth import (
     TokenData,
     UserLogin,
     UserResponse,
+    build_user_response,
     UserCreate,
     UserUpdate,
     UserListResponse,
@@ -23,6 +24,7 @@ __all__ = [
     "TokenData",
     "UserLogin",
     "UserResponse",
+    "build_user_response",
     "UserCreate",
     "UserUpdate",
     "UserListResponse",
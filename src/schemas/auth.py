@@ -2,7 +2,7 @@
 Schemas de Autenticación
 """
 from __future__ import annotations
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from typing import Optional
 from datetime import datetime
 
@@ -12,28 +12,33 @@ class UserLogin(BaseModel):
     email: EmailStr = Field(..., description="Email del usuario")
     password: str = Field(..., min_length=6, description="Contraseña del usuario")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "email": "admin@digitaltwins.com",
                 "password": "admin123"
             }
         }
+    )
 
 
 class UserResponse(BaseModel):
     """Schema para respuesta de usuario"""
     id: int = Field(..., description="ID del usuario")
     name: str = Field(..., description="Nombre del usuario")
-    email: EmailStr = Field(..., description="Email del usuario")
+    # str: el email ya se validó al entrar; format solo mantiene la documentación OpenAPI
+    email: str = Field(..., description="Email del usuario", json_schema_extra={"format": "email"})
     role: str = Field(..., description="Rol del usuario")
     is_active: bool = Field(..., description="Estado activo del usuario")
     created_at: Optional[datetime] = Field(None, description="Fecha de creación")
     temporary_password: Optional[str] = Field(None, description="Contraseña temporal generada (solo en creación)")
     
-    class Config:
-        from_attributes = True
-        json_schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        from_attributes=True,
+        frozen=True,
+        extra="ignore",
+        json_schema_extra={
             "example": {
                 "id": 1,
                 "name": "Administrador Principal",
@@ -43,6 +48,31 @@ class UserResponse(BaseModel):
                 "created_at": "2025-10-02T00:00:00Z"
             }
         }
+    )
+
+
+def build_user_response(user) -> UserResponse:
+    """
+    Construye un UserResponse sin revalidar los datos
+    
+    Solo para datos de confianza leídos de nuestra base de datos (entidad
+    User o fila con las mismas columnas); lo externo pasa por model_validate.
+    
+    Args:
+        user: Entidad User o fila con las columnas de UserResponse
+        
+    Returns:
+        UserResponse: Respuesta lista para serializar
+    """
+    role = user.role
+    return UserResponse.model_construct(
+        id=user.id,
+        name=user.name,
+        email=user.email,
+        role=getattr(role, "value", role),
+        is_active=user.is_active,
+        created_at=user.created_at
+    )
 
 
 class Token(BaseModel):
@@ -52,8 +82,10 @@ class Token(BaseModel):
     expires_in: int = Field(..., description="Tiempo de expiración en segundos")
     user: UserResponse = Field(..., description="Información del usuario")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        frozen=True,
+        json_schema_extra={
             "example": {
                 "access_token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9...",
                 "token_type": "bearer",
@@ -67,12 +99,14 @@ class Token(BaseModel):
                 }
             }
         }
+    )
 
 
 class TokenData(BaseModel):
     """Schema para datos del token"""
     email: Optional[str] = None
     role: Optional[str] = None
+    exp: Optional[int] = None
 
 
 class UserCreate(BaseModel):
@@ -82,8 +116,8 @@ class UserCreate(BaseModel):
     role: str = Field(..., description="Rol del usuario")
     password: Optional[str] = Field(None, min_length=8, max_length=128, description="Contraseña manual (opcional, se genera automáticamente si no se proporciona)")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "name": "Nuevo Usuario",
                 "email": "nuevo@digitaltwins.com",
@@ -91,6 +125,7 @@ class UserCreate(BaseModel):
                 "password": "MiContraseña123!"
             }
         }
+    )
 
 
 class UserUpdate(BaseModel):
@@ -100,8 +135,8 @@ class UserUpdate(BaseModel):
     role: Optional[str] = Field(None, description="Rol del usuario")
     is_active: Optional[bool] = Field(None, description="Estado activo del usuario")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "name": "Usuario Actualizado",
                 "email": "actualizado@digitaltwins.com",
@@ -109,19 +144,19 @@ class UserUpdate(BaseModel):
                 "is_active": True
             }
         }
+    )
 
 
 class UserListResponse(BaseModel):
     """Schema para lista de usuarios"""
     id: int = Field(..., description="ID del usuario")
     name: str = Field(..., description="Nombre del usuario")
-    email: EmailStr = Field(..., description="Email del usuario")
+    email: str = Field(..., description="Email del usuario", json_schema_extra={"format": "email"})
     role: str = Field(..., description="Rol del usuario")
     is_active: bool = Field(..., description="Estado activo del usuario")
     created_at: Optional[datetime] = Field(None, description="Fecha de creación")
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(defer_build=True, frozen=True, from_attributes=True)
 
 
 class PasswordResetResponse(BaseModel):
@@ -129,13 +164,16 @@ class PasswordResetResponse(BaseModel):
     message: str = Field(..., description="Mensaje de confirmación")
     temporary_password: Optional[str] = Field(None, description="Contraseña temporal generada (opcional)")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        frozen=True,
+        json_schema_extra={
             "example": {
                 "message": "Nueva contraseña generada exitosamente",
                 "temporary_password": "TempPass123!"
             }
         }
+    )
 
 
 class RoleInfo(BaseModel):
@@ -143,11 +181,15 @@ class RoleInfo(BaseModel):
     value: str = Field(..., description="Valor del rol")
     label: str = Field(..., description="Etiqueta del rol")
     description: str = Field(..., description="Descripción del rol")
+    
+    model_config = ConfigDict(frozen=True)
 
 
 class RolesResponse(BaseModel):
     """Schema para respuesta de roles disponibles"""
     roles: list[RoleInfo] = Field(..., description="Lista de roles disponibles")
+    
+    model_config = ConfigDict(frozen=True)
 
 
 class HealthResponse(BaseModel):
@@ -157,8 +199,10 @@ class HealthResponse(BaseModel):
     version: str = Field(..., description="Versión del servicio")
     database: str = Field(..., description="Estado de la base de datos")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        frozen=True,
+        json_schema_extra={
             "example": {
                 "status": "healthy",
                 "service": "MS-AUTH-PY",
@@ -166,6 +210,7 @@ class HealthResponse(BaseModel):
                 "database": "connected"
             }
         }
+    )
 
 
 class ForgotPasswordRequest(BaseModel):
@@ -175,12 +220,13 @@ class ForgotPasswordRequest(BaseModel):
     phone_number: Optional[str] = Field(None, description="Número de teléfono (requerido si verification_method='phone')")
     security_answer: Optional[str] = Field(None, description="Respuesta a la pregunta de seguridad (requerido si verification_method='security_question')")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "email": "admin@digitaltwins.com"
             }
         }
+    )
 
 
 class ResetPasswordRequest(BaseModel):
@@ -190,28 +236,31 @@ class ResetPasswordRequest(BaseModel):
     token: Optional[str] = Field(None, description="Token de restablecimiento (si no se usó SMS)")
     new_password: str = Field(..., min_length=6, description="Nueva contraseña")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "email": "admin@digitaltwins.com",
                 "reset_code": "123456",
                 "new_password": "nuevaPassword123"
             }
         }
+    )
 
 
 class ForgotPasswordResponse(BaseModel):
     """Schema para respuesta de solicitud de restablecimiento"""
     message: str = Field(..., description="Mensaje de confirmación")
-    reset_code: Optional[str] = Field(None, description="Código de 6 dígitos enviado por SMS (aplicación local - se muestra en pantalla)")
+    reset_code: Optional[str] = Field(None, description="Reservado por compatibilidad: el código de 6 dígitos solo se envía por email")
     token: Optional[str] = Field(None, description="Token de restablecimiento (fallback si no hay teléfono)")
     security_question: Optional[str] = Field(None, description="Pregunta de seguridad del usuario (si aplica)")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        frozen=True,
+        json_schema_extra={
             "example": {
-                "message": "Código de verificación enviado. Copie el código de la pantalla.",
-                "reset_code": "123456"
+                "message": "Se ha enviado un código de 6 dígitos a tu correo electrónico."
             }
         }
+    )
 
@@ -1,33 +1,150 @@
 """
 Utilidades del microservicio
+
+Los símbolos se importan de forma perezosa (PEP 562): importar el paquete no
+carga bcrypt, PyJWT ni SQLAlchemy hasta que se usa alguno de sus nombres.
 """
-from .security import (
-    verify_password,
-    get_password_hash,
-    generate_reset_token,
-    get_reset_token_expiration,
-    is_reset_token_valid,
-    generate_reset_code,
-    get_reset_code_expiration,
-    is_reset_code_valid,
-    hash_security_answer,
-    verify_security_answer
-)
-from .auth import create_access_token, decode_token, get_current_user
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .security import (
+        verify_password,
+        averify_password,
+        verify_dummy_password,
+        is_password_verification_cached,
+        password_needs_rehash,
+        secrets_match,
+        get_password_hash,
+        aget_password_hash,
+        generate_reset_token,
+        get_reset_token_expiration,
+        is_reset_token_valid,
+        ResetToken,
+        new_reset_token,
+        generate_reset_code,
+        get_reset_code_expiration,
+        is_reset_code_valid,
+        hash_security_answer,
+        verify_security_answer,
+        averify_security_answer,
+        security_answer_needs_rehash,
+        run_password_hashing
+    )
+    from .auth import (
+        AuthContext,
+        CurrentUser,
+        oauth2_scheme,
+        create_access_token,
+        decode_token,
+        get_current_user,
+        get_auth_context,
+        revoke_access_token,
+        invalidate_current_user_cache
+    )
+    from .introspection import install_introspection_cache
+    from .audit import audit_event, setup_audit_logging, stop_audit_logging
+    from .responses import model_response
+
+# Nombre público -> submódulo que lo define
+_LAZY = {
+    "verify_password": "security",
+    "averify_password": "security",
+    "verify_dummy_password": "security",
+    "is_password_verification_cached": "security",
+    "password_needs_rehash": "security",
+    "secrets_match": "security",
+    "get_password_hash": "security",
+    "aget_password_hash": "security",
+    "generate_reset_token": "security",
+    "get_reset_token_expiration": "security",
+    "is_reset_token_valid": "security",
+    "ResetToken": "security",
+    "new_reset_token": "security",
+    "generate_reset_code": "security",
+    "get_reset_code_expiration": "security",
+    "is_reset_code_valid": "security",
+    "hash_security_answer": "security",
+    "verify_security_answer": "security",
+    "averify_security_answer": "security",
+    "security_answer_needs_rehash": "security",
+    "run_password_hashing": "security",
+    "AuthContext": "auth",
+    "CurrentUser": "auth",
+    "oauth2_scheme": "auth",
+    "create_access_token": "auth",
+    "decode_token": "auth",
+    "get_current_user": "auth",
+    "get_auth_context": "auth",
+    "revoke_access_token": "auth",
+    "invalidate_current_user_cache": "auth",
+    "install_introspection_cache": "introspection",
+    "audit_event": "audit",
+    "setup_audit_logging": "audit",
+    "stop_audit_logging": "audit",
+    "model_response": "responses",
+}
 
 __all__ = [
     "verify_password",
+    "averify_password",
+    "verify_dummy_password",
+    "is_password_verification_cached",
+    "password_needs_rehash",
+    "secrets_match",
     "get_password_hash",
+    "aget_password_hash",
     "generate_reset_token",
     "get_reset_token_expiration",
     "is_reset_token_valid",
+    "ResetToken",
+    "new_reset_token",
     "generate_reset_code",
     "get_reset_code_expiration",
     "is_reset_code_valid",
     "hash_security_answer",
     "verify_security_answer",
+    "averify_security_answer",
+    "security_answer_needs_rehash",
+    "run_password_hashing",
+    "AuthContext",
+    "CurrentUser",
+    "oauth2_scheme",
     "create_access_token",
     "decode_token",
-    "get_current_user"
+    "get_current_user",
+    "get_auth_context",
+    "revoke_access_token",
+    "invalidate_current_user_cache",
+    "install_introspection_cache",
+    "audit_event",
+    "setup_audit_logging",
+    "stop_audit_logging",
+    "model_response"
 ]
 
+
+def __getattr__(name: str) -> Any:
+    """
+    Importa el submódulo que define el símbolo la primera vez que se pide
+
+    Args:
+        name: Nombre del símbolo
+
+    Returns:
+        Any: Símbolo exportado
+
+    Raises:
+        AttributeError: Si el paquete no exporta ese nombre
+    """
+    module_name = _LAZY.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    # Se guarda en el namespace del paquete: los siguientes accesos no pasan por aquí
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(__all__))
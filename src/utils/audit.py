@@ -0,0 +1,77 @@
+"""
+Log de auditoría encolado
+"""
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+audit_logger = logging.getLogger("audit")
+
+_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea el registro en el hilo que lo emite
+
+    QueueHandler.prepare() interpola el mensaje antes de encolarlo; aquí se
+    encola tal cual para que el formateo ocurra en el hilo del listener. Los
+    argumentos de auditoría son valores inmutables (str/int), así que es seguro.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_audit_logging() -> None:
+    """
+    Conecta el logger "audit" a una cola atendida por un hilo en segundo plano
+
+    El request solo encola el registro; la escritura a stdout la hace el
+    QueueListener. Es idempotente.
+    """
+    global _handler, _listener
+    if _listener is not None:
+        return
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(
+        logging.Formatter("%(asctime)s [AUDIT] %(event)s: %(message)s")
+    )
+
+    _handler = _DeferredQueueHandler(log_queue)
+    audit_logger.addHandler(_handler)
+    audit_logger.setLevel(logging.INFO)
+    audit_logger.propagate = False
+
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(stop_audit_logging)
+
+
+def stop_audit_logging() -> None:
+    """Vacía la cola de auditoría y detiene el hilo del listener"""
+    global _handler, _listener
+    if _listener is None:
+        return
+    audit_logger.removeHandler(_handler)
+    audit_logger.propagate = True
+    _listener.stop()
+    _handler = _listener = None
+
+
+def audit_event(event: str, message: str, *args: Any) -> None:
+    """
+    Registra un evento de auditoría con formateo diferido (estilo %)
+
+    Args:
+        event: Nombre del evento (ej: user_created)
+        message: Mensaje con marcadores %s
+        *args: Valores del mensaje
+    """
+    audit_logger.info(message, *args, extra={"event": event})
@@ -1,20 +1,126 @@
 """
 Utilidades de autenticación JWT
 """
+import hashlib
+import secrets
+import time
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from cachetools import TLRUCache, TTLCache
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import settings
-from ..models import get_db, User
+from ..models import get_db, User, UserRole
 from ..schemas import TokenData
 
 # OAuth2 scheme para el header Authorization
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_PREFIX}/login")
 
+# Clave de firma y cabecera JWT calculadas una sola vez al importar el módulo.
+# PyJWT firma HS256 con hmac/hashlib, que usa la implementación de OpenSSL de CPython.
+_SIGNING_KEY = settings.SECRET_KEY.encode()
+_JWT_HEADERS = {"typ": "JWT"}
+_JWT_ALGORITHMS = [settings.ALGORITHM]
+# Vigencia por defecto en segundos: exp se calcula como entero epoch (RFC 7519)
+_DEFAULT_EXP_SECS = settings.ACCESS_TOKEN_EXPIRE_SECONDS
+
+# Usuarios autenticados recientemente, por hash del token: evita decodificar el
+# JWT y consultar la BD en cada petición. El TTL acota cuánto tarda en verse un
+# cambio hecho desde otro proceso (desactivación, cambio de rol)
+_CURRENT_USER_CACHE_TTL_SECONDS = min(300, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+_current_user_cache: TTLCache = TTLCache(maxsize=10_000, ttl=_CURRENT_USER_CACHE_TTL_SECONDS)
+
+# Datos del usuario por email (minúsculas), compartidos por todos sus tokens: un
+# token nuevo (login, otro dispositivo) no vuelve a la BD. TTL corto porque otros
+# procesos no pueden invalidarla
+_USER_BY_EMAIL_TTL_SECONDS = 15
+_users_by_email: TTLCache = TTLCache(maxsize=4096, ttl=_USER_BY_EMAIL_TTL_SECONDS)
+
+# Consulta del usuario autenticado: solo las columnas de CurrentUser
+_CURRENT_USER_STMT = select(
+    User.id, User.name, User.email, User.role, User.is_active, User.created_at
+).where(func.lower(User.email) == bindparam("email"))
+
+# Tokens ya decodificados, por hash del token: sobreviven a invalidate_current_user_cache
+# (que descarta usuarios, no firmas) y cada entrada vence con el exp del propio token
+_DECODED_TOKEN_MAX_TTL_SECONDS = 300
+
+
+def _decoded_token_ttu(key: bytes, token_data: TokenData, now: float) -> float:
+    """Vencimiento de una entrada: el exp del token, como mucho 5 minutos"""
+    expires = now + _DECODED_TOKEN_MAX_TTL_SECONDS
+    if token_data.exp is not None:
+        expires = min(expires, token_data.exp)
+    return expires
+
+
+_decoded_tokens: TLRUCache = TLRUCache(maxsize=10_000, ttu=_decoded_token_ttu, timer=time.time)
+
+# Tokens cerrados con /logout (caché negativa mientras el token podría seguir vigente).
+# Best-effort: es por proceso y, si se llena antes del TTL, descarta los más antiguos,
+# que vuelven a ser válidos. REVOKED_TOKENS_MAX_SIZE debe superar los logouts
+# esperados durante la vigencia de un token
+_revoked_tokens: TTLCache = TTLCache(
+    maxsize=settings.REVOKED_TOKENS_MAX_SIZE,
+    ttl=settings.ACCESS_TOKEN_EXPIRE_SECONDS
+)
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Copia inmutable de los datos del usuario autenticado (apta para caché)"""
+    id: int
+    name: str
+    email: str
+    role: UserRole
+    is_active: bool
+    created_at: Optional[datetime]
+    token_exp: Optional[int] = None
+
+
+def _token_cache_key(token: str) -> bytes:
+    """
+    Calcula la clave de caché de un token (no se guarda el token en claro)
+    
+    Args:
+        token: Token JWT
+        
+    Returns:
+        bytes: Digest BLAKE2b de 16 bytes
+    """
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def revoke_access_token(token: str) -> None:
+    """
+    Revoca un token en este proceso (usado por /logout)
+    
+    La revocación es best-effort: no se comparte con otras réplicas ni
+    sobrevive a un reinicio, y si la caché alcanza REVOKED_TOKENS_MAX_SIZE
+    antes de que venza el TTL se descartan los tokens revocados más antiguos.
+    
+    Args:
+        token: Token JWT a revocar
+    """
+    key = _token_cache_key(token)
+    _revoked_tokens[key] = True
+    _current_user_cache.pop(key, None)
+    _decoded_tokens.pop(key, None)
+
+
+def invalidate_current_user_cache() -> None:
+    """
+    Descarta los usuarios cacheados para que la siguiente petición los relea
+    
+    Se llama cuando se modifica un usuario (estado, rol, email).
+    """
+    _current_user_cache.clear()
+    _users_by_email.clear()
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
@@ -27,15 +133,20 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     Returns:
         str: Token JWT
     """
+    # Import diferido: PyJWT no se carga al iniciar
+    import jwt
+    
     to_encode = data.copy()
     
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    # exp numérico: PyJWT lo acepta tal cual, sin construir datetimes por llamada
+    lifetime = int(expires_delta.total_seconds()) if expires_delta else _DEFAULT_EXP_SECS
+    expire = int(time.time()) + lifetime
     
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    # jti único: dos logins en el mismo segundo no comparten token (ni revocación)
+    to_encode.update({"exp": expire, "jti": secrets.token_urlsafe(12)})
+    encoded_jwt = jwt.encode(
+        to_encode, _SIGNING_KEY, algorithm=settings.ALGORITHM, headers=_JWT_HEADERS
+    )
     
     return encoded_jwt
 
@@ -44,6 +155,9 @@ def decode_token(token: str) -> TokenData:
     """
     Decodifica y valida un token JWT
     
+    Los JWT son inmutables: una firma ya verificada se reutiliza (por hash del
+    token) hasta que el token expira, sin repetir HMAC ni el parseo del JSON.
+    
     Args:
         token: Token JWT a decodificar
         
@@ -53,6 +167,13 @@ def decode_token(token: str) -> TokenData:
     Raises:
         HTTPException: Si el token es inválido
     """
+    key = _token_cache_key(token)
+    cached = _decoded_tokens.get(key)
+    if cached is not None:
+        return cached
+    
+    import jwt
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
@@ -60,33 +181,56 @@ def decode_token(token: str) -> TokenData:
     )
     
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = jwt.decode(token, _SIGNING_KEY, algorithms=_JWT_ALGORITHMS)
         email: str = payload.get("sub")
         role: str = payload.get("role")
         
         if email is None:
             raise credentials_exception
             
-        token_data = TokenData(email=email, role=role)
+        token_data = TokenData(email=email, role=role, exp=payload.get("exp"))
+        _decoded_tokens[key] = token_data
         return token_data
         
-    except JWTError:
+    except jwt.PyJWTError:
         raise credentials_exception
 
 
+async def _fetch_current_user_row(request: Request, email: str):
+    """
+    Lee el usuario de la BD abriendo una sesión solo para esta consulta
+    
+    La sesión sale de la fábrica app.state.SessionLocal, que los tests
+    reemplazan por la suya.
+    
+    Args:
+        request: Petición en curso
+        email: Email del usuario en minúsculas
+        
+    Returns:
+        Row: Columnas de CurrentUser, o None si no existe
+    """
+    async with request.app.state.SessionLocal() as db:
+        return (await db.execute(_CURRENT_USER_STMT, {"email": email})).first()
+
+
 async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
+    request: Request,
+    token: str = Depends(oauth2_scheme)
+) -> CurrentUser:
     """
     Obtiene el usuario actual desde el token JWT
     
+    Los usuarios ya validados se sirven desde una caché TTL en memoria hasta
+    que el token expira, se revoca con /logout o se modifica algún usuario.
+    Solo en un fallo de caché se abre una sesión de base de datos.
+    
     Args:
+        request: Petición en curso
         token: Token JWT del header Authorization
-        db: Sesión de base de datos
         
     Returns:
-        User: Usuario autenticado
+        CurrentUser: Usuario autenticado
         
     Raises:
         HTTPException: Si el token es inválido o el usuario no existe
@@ -97,12 +241,35 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    token_data = decode_token(token)
+    key = _token_cache_key(token)
+    if key in _revoked_tokens:
+        raise credentials_exception
+    
+    cached = _current_user_cache.get(key)
+    if cached is not None:
+        if cached.token_exp is None or time.time() < cached.token_exp:
+            return cached
+        # El token expiró dentro del TTL de la caché
+        del _current_user_cache[key]
+        raise credentials_exception
     
-    user = db.query(User).filter(User.email == token_data.email).first()
+    token_data = decode_token(token)
+    email = token_data.email.lower()
     
+    user = _users_by_email.get(email)
     if user is None:
-        raise credentials_exception
+        row = await _fetch_current_user_row(request, email)
+        if row is None:
+            raise credentials_exception
+        user = CurrentUser(
+            id=row.id,
+            name=row.name,
+            email=row.email,
+            role=row.role,
+            is_active=row.is_active,
+            created_at=row.created_at
+        )
+        _users_by_email[email] = user
         
     if not user.is_active:
         raise HTTPException(
@@ -110,12 +277,41 @@ async def get_current_user(
             detail="Usuario inactivo"
         )
     
-    return user
+    current_user = replace(user, token_exp=token_data.exp)
+    _current_user_cache[key] = current_user
+    return current_user
+
+
+@dataclass(frozen=True)
+class AuthContext:
+    """Sesión de base de datos y usuario autenticado de una petición"""
+    db: AsyncSession
+    user: CurrentUser
+
+
+async def get_auth_context(
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+) -> AuthContext:
+    """
+    Agrupa la sesión y el usuario autenticado en una sola dependency
+    
+    get_current_user no depende de get_db (solo abre una sesión propia en un
+    fallo de caché), así que la sesión de la petición es solo la del handler.
+    
+    Args:
+        db: Sesión de base de datos
+        current_user: Usuario autenticado
+        
+    Returns:
+        AuthContext: Sesión y usuario de la petición
+    """
+    return AuthContext(db=db, user=current_user)
 
 
 async def get_current_active_admin(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: CurrentUser = Depends(get_current_user)
+) -> CurrentUser:
     """
     Verifica que el usuario actual sea un administrador activo
     
@@ -123,7 +319,7 @@ async def get_current_active_admin(
         current_user: Usuario actual
         
     Returns:
-        User: Usuario administrador
+        CurrentUser: Usuario administrador
         
     Raises:
         HTTPException: Si el usuario no es administrador
@@ -1,59 +1,37 @@
 """
 Utilidades para envío de emails
 """
-import aiosmtplib
+import asyncio
+import base64
+import html
+import logging
+from email.header import Header
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from string import Template
 from typing import Optional
+import aiosmtplib
 from ..config import settings
 
+logger = logging.getLogger(__name__)
 
-async def send_reset_password_email(
-    to_email: str,
-    reset_code: Optional[str] = None,
-    reset_token: Optional[str] = None,
-    user_name: Optional[str] = None
-) -> bool:
-    """
-    Envía email de restablecimiento de contraseña
-    
-    Args:
-        to_email: Email del destinatario
-        reset_code: Código de 6 dígitos (si se usa SMS/email)
-        reset_token: Token de restablecimiento (si se usa método simple)
-        user_name: Nombre del usuario (opcional)
-        
-    Returns:
-        bool: True si se envió correctamente, False si no
-    """
-    # Si SMTP no está habilitado, no enviar (solo desarrollo)
-    if not settings.SMTP_ENABLED:
-        print("⚠️ SMTP_ENABLED=False - Email no se enviará, se mostrará en pantalla")
-        return False
-    
-    # Validar configuración SMTP
-    if not settings.SMTP_USER or not settings.SMTP_PASSWORD:
-        print(f"⚠️ Configuración SMTP incompleta - USER: {bool(settings.SMTP_USER)}, PASSWORD: {bool(settings.SMTP_PASSWORD)}")
-        return False
-    
-    print(f"📧 Intentando enviar email a {to_email} desde {settings.SMTP_USER}")
-    
-    try:
-        # Crear mensaje
-        message = MIMEMultipart("alternative")
-        message["Subject"] = "Restablecimiento de Contraseña - Sistema Digital Twins"
-        message["From"] = f"{settings.SMTP_FROM_NAME} <{settings.SMTP_FROM_EMAIL}>"
-        message["To"] = to_email
-        
-        # Crear contenido del email
-        if reset_code:
-            # Email con código de 6 dígitos
-            text_content = f"""
-Hola {user_name or 'Usuario'},
+# Cabeceras constantes del mensaje (se arman una sola vez)
+_SUBJECT = "Restablecimiento de Contraseña - Sistema Digital Twins"
+_FROM = f"{settings.SMTP_FROM_NAME} <{settings.SMTP_FROM_EMAIL}>"
+_RESET_URL = "http://localhost:8080/forgot-password?token="
+
+# Conexión SMTP reutilizada entre envíos (TCP + TLS + AUTH una sola vez); el lock
+# serializa su uso porque un cliente SMTP no admite transacciones concurrentes
+_smtp_client: Optional[aiosmtplib.SMTP] = None
+_smtp_lock = asyncio.Lock()
+
+# Plantillas compiladas al importar; en el HTML los valores se escapan antes de sustituir
+_CODE_TEXT_TMPL = Template("""
+Hola $user_name,
 
 Has solicitado restablecer tu contraseña en el Sistema Digital Twins.
 
-Tu código de verificación es: {reset_code}
+Tu código de verificación es: $reset_code
 
 Este código es válido por 10 minutos.
 
@@ -61,26 +39,26 @@ Si no solicitaste este restablecimiento, por favor ignora este email.
 
 Saludos,
 Equipo Digital Twins
-            """
-            
-            html_content = f"""
+""")
+
+_CODE_HTML_TMPL = Template("""
 <!DOCTYPE html>
 <html>
 <head>
     <meta charset="utf-8">
     <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .code {{ background-color: #f4f4f4; padding: 20px; text-align: center; font-size: 32px; font-weight: bold; letter-spacing: 5px; margin: 20px 0; border-radius: 5px; }}
-        .footer {{ margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; font-size: 12px; color: #666; }}
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .code { background-color: #f4f4f4; padding: 20px; text-align: center; font-size: 32px; font-weight: bold; letter-spacing: 5px; margin: 20px 0; border-radius: 5px; }
+        .footer { margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; font-size: 12px; color: #666; }
     </style>
 </head>
 <body>
     <div class="container">
         <h2>Restablecimiento de Contraseña</h2>
-        <p>Hola {user_name or 'Usuario'},</p>
+        <p>Hola $user_name,</p>
         <p>Has solicitado restablecer tu contraseña en el Sistema Digital Twins.</p>
-        <div class="code">{reset_code}</div>
+        <div class="code">$reset_code</div>
         <p>Este código es válido por <strong>10 minutos</strong>.</p>
         <p>Si no solicitaste este restablecimiento, por favor ignora este email.</p>
         <div class="footer">
@@ -89,21 +67,18 @@ Equipo Digital Twins
     </div>
 </body>
 </html>
-            """
-        else:
-            # Email con token
-            reset_url = f"http://localhost:8080/forgot-password?token={reset_token}"
-            
-            text_content = f"""
-Hola {user_name or 'Usuario'},
+""")
+
+_TOKEN_TEXT_TMPL = Template("""
+Hola $user_name,
 
 Has solicitado restablecer tu contraseña en el Sistema Digital Twins.
 
 Tu token de restablecimiento es:
-{reset_token}
+$reset_token
 
 O haz clic en el siguiente enlace:
-{reset_url}
+$reset_url
 
 Este token es válido por 1 hora.
 
@@ -111,29 +86,29 @@ Si no solicitaste este restablecimiento, por favor ignora este email.
 
 Saludos,
 Equipo Digital Twins
-            """
-            
-            html_content = f"""
+""")
+
+_TOKEN_HTML_TMPL = Template("""
 <!DOCTYPE html>
 <html>
 <head>
     <meta charset="utf-8">
     <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .token {{ background-color: #f4f4f4; padding: 15px; word-break: break-all; margin: 20px 0; border-radius: 5px; font-family: monospace; }}
-        .button {{ display: inline-block; padding: 12px 24px; background-color: #007bff; color: white; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-        .footer {{ margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; font-size: 12px; color: #666; }}
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .token { background-color: #f4f4f4; padding: 15px; word-break: break-all; margin: 20px 0; border-radius: 5px; font-family: monospace; }
+        .button { display: inline-block; padding: 12px 24px; background-color: #007bff; color: white; text-decoration: none; border-radius: 5px; margin: 20px 0; }
+        .footer { margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; font-size: 12px; color: #666; }
     </style>
 </head>
 <body>
     <div class="container">
         <h2>Restablecimiento de Contraseña</h2>
-        <p>Hola {user_name or 'Usuario'},</p>
+        <p>Hola $user_name,</p>
         <p>Has solicitado restablecer tu contraseña en el Sistema Digital Twins.</p>
-        <div class="token">{reset_token}</div>
+        <div class="token">$reset_token</div>
         <p>O haz clic en el siguiente botón:</p>
-        <a href="{reset_url}" class="button">Restablecer Contraseña</a>
+        <a href="$reset_url" class="button">Restablecer Contraseña</a>
         <p>Este token es válido por <strong>1 hora</strong>.</p>
         <p>Si no solicitaste este restablecimiento, por favor ignora este email.</p>
         <div class="footer">
@@ -142,45 +117,204 @@ Equipo Digital Twins
     </div>
 </body>
 </html>
-            """
-        
-        # Agregar partes al mensaje
-        text_part = MIMEText(text_content, "plain", "utf-8")
-        html_part = MIMEText(html_content, "html", "utf-8")
-        message.attach(text_part)
-        message.attach(html_part)
+""")
+
+
+# Marcadores del mensaje pre-serializado (no pueden aparecer en base64 ni en un email válido)
+_TO_MARK = b"@@TO@@"
+_TEXT_MARK = b"@@TEXT@@"
+_HTML_MARK = b"@@HTML@@"
+
+
+def _build_message_template() -> bytes:
+    """
+    Serializa una sola vez las cabeceras y la estructura multipart del mensaje
+    
+    Ambos emails (código y token) comparten asunto, remitente y estructura;
+    solo cambian el destinatario y los cuerpos, que se insertan ya codificados.
+    
+    Returns:
+        bytes: Mensaje MIME con marcadores en lugar de To y de los cuerpos
+    """
+    message = MIMEMultipart("alternative")
+    message["Subject"] = _SUBJECT
+    message["From"] = _FROM
+    message["To"] = _TO_MARK.decode()
+    for subtype, mark in (("plain", _TEXT_MARK), ("html", _HTML_MARK)):
+        part = MIMEText("", subtype, "utf-8")
+        # Cabeceras base64/utf-8 ya fijadas; el payload se sustituye al enviar
+        part.set_payload(mark.decode())
+        message.attach(part)
+    return message.as_bytes()
+
+
+_MESSAGE_TMPL = _build_message_template()
+
+
+def _render_message(to_email: str, text_content: str, html_content: str) -> bytes:
+    """
+    Completa el mensaje pre-serializado con el destinatario y los cuerpos
+    
+    Args:
+        to_email: Email del destinatario
+        text_content: Cuerpo en texto plano
+        html_content: Cuerpo HTML
         
-        # Enviar email
-        print(f"🔐 Conectando a SMTP: {settings.SMTP_HOST}:{settings.SMTP_PORT}")
-        print(f"👤 Usuario SMTP: {settings.SMTP_USER}")
+    Returns:
+        bytes: Mensaje listo para SMTP DATA
+    """
+    to_header = to_email if to_email.isascii() else Header(to_email, "utf-8").encode()
+    return (
+        _MESSAGE_TMPL
+        .replace(_TEXT_MARK, base64.encodebytes(text_content.encode()).rstrip(b"\n"))
+        .replace(_HTML_MARK, base64.encodebytes(html_content.encode()).rstrip(b"\n"))
+        .replace(_TO_MARK, to_header.encode())
+    )
+
+
+async def _get_smtp_client() -> aiosmtplib.SMTP:
+    """
+    Devuelve el cliente SMTP abierto, conectándolo y autenticándolo si hace falta
+    
+    Debe llamarse con _smtp_lock tomado.
+    
+    Returns:
+        aiosmtplib.SMTP: Cliente conectado y autenticado
+    """
+    global _smtp_client
+    if _smtp_client is not None and _smtp_client.is_connected:
+        return _smtp_client
+    
+    logger.debug(
+        "Conectando a SMTP %s:%s con usuario %s",
+        settings.SMTP_HOST, settings.SMTP_PORT, settings.SMTP_USER
+    )
+    # Gmail usa puerto 587 con STARTTLS (no use_tls)
+    client = aiosmtplib.SMTP(
+        hostname=settings.SMTP_HOST,
+        port=settings.SMTP_PORT,
+        username=settings.SMTP_USER,
+        password=settings.SMTP_PASSWORD.strip(),  # Quitar espacios si los hay
+        start_tls=True if settings.SMTP_PORT == 587 else False,  # STARTTLS para puerto 587
+        use_tls=True if settings.SMTP_PORT == 465 else False,  # TLS directo para puerto 465
+    )
+    # connect() negocia STARTTLS y hace AUTH con las credenciales del cliente
+    await client.connect()
+    _smtp_client = client
+    return client
+
+
+async def _discard_smtp_client() -> None:
+    """Cierra y olvida el cliente SMTP actual (el siguiente envío reconecta)"""
+    global _smtp_client
+    client, _smtp_client = _smtp_client, None
+    if client is not None and client.is_connected:
+        try:
+            await client.quit()
+        except aiosmtplib.SMTPException:
+            client.close()
+
+
+async def close_smtp_client() -> None:
+    """Cierra la conexión SMTP reutilizada (al apagar la aplicación)"""
+    async with _smtp_lock:
+        await _discard_smtp_client()
+
+
+async def _send_message(to_email: str, message: bytes) -> None:
+    """
+    Envía un mensaje por la conexión reutilizada
+    
+    Si el servidor cerró la conexión inactiva se reconecta y reintenta una vez.
+    
+    Args:
+        to_email: Email del destinatario
+        message: Mensaje serializado (ver _render_message)
+    """
+    async with _smtp_lock:
+        try:
+            client = await _get_smtp_client()
+            try:
+                await client.sendmail(settings.SMTP_FROM_EMAIL, [to_email], message)
+            except aiosmtplib.SMTPServerDisconnected:
+                await _discard_smtp_client()
+                client = await _get_smtp_client()
+                await client.sendmail(settings.SMTP_FROM_EMAIL, [to_email], message)
+        except BaseException:
+            # Estado de la sesión desconocido: no reutilizarla
+            await _discard_smtp_client()
+            raise
+
+
+async def send_reset_password_email(
+    to_email: str,
+    reset_code: Optional[str] = None,
+    reset_token: Optional[str] = None,
+    user_name: Optional[str] = None
+) -> bool:
+    """
+    Envía email de restablecimiento de contraseña
+    
+    Args:
+        to_email: Email del destinatario
+        reset_code: Código de 6 dígitos (si se usa SMS/email)
+        reset_token: Token de restablecimiento (si se usa método simple)
+        user_name: Nombre del usuario (opcional)
         
-        # Gmail usa puerto 587 con STARTTLS (no use_tls)
-        await aiosmtplib.send(
-            message,
-            hostname=settings.SMTP_HOST,
-            port=settings.SMTP_PORT,
-            username=settings.SMTP_USER,
-            password=settings.SMTP_PASSWORD.strip(),  # Quitar espacios si los hay
-            start_tls=True if settings.SMTP_PORT == 587 else False,  # STARTTLS para puerto 587
-            use_tls=True if settings.SMTP_PORT == 465 else False,  # TLS directo para puerto 465
+    Returns:
+        bool: True si se envió correctamente, False si no
+    """
+    # Si SMTP no está habilitado, no enviar (solo desarrollo)
+    if not settings.SMTP_ENABLED:
+        logger.warning("SMTP_ENABLED=False - el email no se enviará")
+        return False
+    
+    # Validar configuración SMTP
+    if not settings.SMTP_USER or not settings.SMTP_PASSWORD:
+        logger.warning(
+            "Configuración SMTP incompleta - USER: %s, PASSWORD: %s",
+            bool(settings.SMTP_USER), bool(settings.SMTP_PASSWORD)
         )
+        return False
+    
+    logger.debug("Intentando enviar email a %s desde %s", to_email, settings.SMTP_USER)
+    
+    try:
+        # Crear contenido del email
+        name = user_name or "Usuario"
+        if reset_code:
+            # Email con código de 6 dígitos
+            text_content = _CODE_TEXT_TMPL.substitute(user_name=name, reset_code=reset_code)
+            html_content = _CODE_HTML_TMPL.substitute(
+                user_name=html.escape(name), reset_code=reset_code
+            )
+        else:
+            # Email con token
+            reset_url = _RESET_URL + reset_token
+            
+            text_content = _TOKEN_TEXT_TMPL.substitute(
+                user_name=name, reset_token=reset_token, reset_url=reset_url
+            )
+            html_content = _TOKEN_HTML_TMPL.substitute(
+                user_name=html.escape(name), reset_token=reset_token, reset_url=reset_url
+            )
+        
+        # Enviar email por la conexión reutilizada (sin reconstruir el árbol MIME)
+        await _send_message(to_email, _render_message(to_email, text_content, html_content))
         
-        print(f"✅ Email enviado exitosamente a {to_email}")
+        logger.info("Email de restablecimiento enviado a %s", to_email)
         return True
         
     except aiosmtplib.SMTPAuthenticationError as e:
-        print(f"❌ Error de autenticación SMTP: {str(e)}")
-        print(f"   Verifica que la contraseña de aplicación sea correcta")
-        print(f"   Usuario: {settings.SMTP_USER}")
+        logger.error(
+            "Error de autenticación SMTP para el usuario %s (verifica la contraseña de aplicación): %s",
+            settings.SMTP_USER, e
+        )
         return False
     except aiosmtplib.SMTPException as e:
-        print(f"❌ Error SMTP: {str(e)}")
-        print(f"   Detalles: HOST={settings.SMTP_HOST}, PORT={settings.SMTP_PORT}")
+        logger.error("Error SMTP (HOST=%s, PORT=%s): %s", settings.SMTP_HOST, settings.SMTP_PORT, e)
         return False
     except Exception as e:
-        print(f"❌ Error inesperado enviando email: {str(e)}")
-        print(f"   Tipo: {type(e).__name__}")
-        import traceback
-        print(f"   Traceback: {traceback.format_exc()}")
+        logger.exception("Error inesperado enviando email a %s", to_email)
         return False
 
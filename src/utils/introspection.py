@@ -0,0 +1,66 @@
+"""
+Caché de introspección de dependencias de FastAPI
+"""
+import functools
+import weakref
+from typing import Any, Callable
+
+# Predicados que solve_dependencies evalúa en cada petición para cada dependency
+_PREDICATES = ("is_coroutine_callable", "is_gen_callable", "is_async_gen_callable")
+
+_installed = False
+
+
+def _cached_predicate(func: Callable[[Any], bool]) -> Callable[[Any], bool]:
+    """
+    Envuelve un predicado inspect.* con una caché por callable
+
+    Se usa WeakKeyDictionary para no mantener vivos los callables; los que no
+    admiten weakref o hash se evalúan sin caché.
+
+    Args:
+        func: Predicado original de FastAPI
+
+    Returns:
+        Callable: Predicado con caché
+    """
+    cache: "weakref.WeakKeyDictionary[Any, bool]" = weakref.WeakKeyDictionary()
+
+    @functools.wraps(func)
+    def wrapper(call: Any) -> bool:
+        try:
+            return cache[call]
+        except KeyError:
+            result = cache[call] = func(call)
+            return result
+        except TypeError:
+            return func(call)
+
+    return wrapper
+
+
+def install_introspection_cache() -> bool:
+    """
+    Cachea los predicados inspect.* que FastAPI recalcula en cada petición
+
+    El resultado de iscoroutinefunction/isgeneratorfunction de un callable no
+    cambia, pero fastapi.dependencies.utils lo evalúa en cada request para
+    cada dependency. Si la versión instalada de FastAPI no expone alguno de
+    los predicados no se parchea nada. Es idempotente.
+
+    Returns:
+        bool: True si la caché quedó instalada
+    """
+    global _installed
+    if _installed:
+        return True
+
+    from fastapi.dependencies import utils as dependency_utils
+
+    if not all(callable(getattr(dependency_utils, name, None)) for name in _PREDICATES):
+        return False
+
+    for name in _PREDICATES:
+        setattr(dependency_utils, name, _cached_predicate(getattr(dependency_utils, name)))
+    _installed = True
+    return True
@@ -0,0 +1,27 @@
+"""
+Respuestas JSON pre-serializadas
+"""
+from fastapi import Response, status
+from pydantic import BaseModel
+
+
+def model_response(model: BaseModel, status_code: int = status.HTTP_200_OK) -> Response:
+    """
+    Serializa un schema directamente a bytes JSON y lo envuelve en una Response
+
+    Usa el serializador compilado del propio modelo (pydantic-core), sin pasar
+    por la validación del response_model ni por jsonable_encoder. El endpoint
+    debe declarar response_model=None y documentar el schema en responses.
+
+    Args:
+        model: Schema ya construido (ej: build_user_response)
+        status_code: Código HTTP de la respuesta
+
+    Returns:
+        Response: Respuesta application/json
+    """
+    return Response(
+        content=model.__pydantic_serializer__.to_json(model),
+        status_code=status_code,
+        media_type="application/json"
+    )
@@ -1,18 +1,324 @@
 """
 Utilidades de seguridad para manejo de contraseñas
 """
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
 import secrets
-from datetime import datetime, timedelta
-from passlib.context import CryptContext
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial
+from typing import Callable, Dict, Optional, TypeVar
+import bcrypt
+from argon2 import PasswordHasher, Type
+from argon2.exceptions import InvalidHashError, VerificationError, VerifyMismatchError
+from cachetools import TTLCache
 
-# Contexto para bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from ..config import settings
+
+T = TypeVar("T")
+
+_UTC = timezone.utc
+# datetime.now ya ligado a UTC: evita buscar el método y pasar la zona en cada llamada
+_now_utc: Callable[[], datetime] = partial(datetime.now, _UTC)
+
+# Mayor múltiplo de 10^6 representable en 24 bits (rechazo sin sesgo para los códigos)
+_RESET_CODE_LIMIT = (1 << 24) // 1000000 * 1000000
+
+# Argon2id (argon2-cffi, implementación de referencia en C) para todos los hashes nuevos
+_argon2 = PasswordHasher(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST,
+    parallelism=settings.ARGON2_PARALLELISM,
+    type=Type.ID
+)
+_ARGON2_PREFIX = "$argon2"
+
+# bcrypt (solo hashes antiguos) considera los primeros 72 bytes; se truncan como hacía passlib
+_BCRYPT_MAX_BYTES = 72
+
+# Pepper del servidor (nunca se guarda en la BD) y prefijo que marca los hashes que lo usan
+_PEPPER = settings.PASSWORD_PEPPER.encode() if settings.PASSWORD_PEPPER else None
+_PEPPER_PREFIX = "$pepper"
+
+# Respuestas de seguridad: HMAC-SHA256 con una llave derivada de la SECRET_KEY
+# (cambiarla invalida las respuestas guardadas). Se deriva una llave propia para
+# no reutilizar la de firma de los JWT. Las respuestas sin este prefijo son
+# hashes bcrypt antiguos
+_ANSWER_HMAC_PREFIX = "$hmac-sha256$"
+_ANSWER_KEY = hmac.new(settings.SECRET_KEY.encode(), b"security-answer", hashlib.sha256).digest()
+
+# Verificaciones exitosas recientes: clave HMAC(hash, contraseña) con una llave
+# aleatoria del proceso, de modo que la caché nunca guarda contraseñas ni hashes.
+# Solo se guardan aciertos: cada contraseña incorrecta sigue pagando el hash completo.
+# Cambiar la contraseña cambia el hash y con él la clave (invalidación implícita)
+_VERIFY_CACHE_KEY = secrets.token_bytes(32)
+_verified_passwords: Optional[TTLCache] = (
+    TTLCache(maxsize=1024, ttl=settings.PASSWORD_VERIFY_CACHE_TTL_SECONDS)
+    if settings.PASSWORD_VERIFY_CACHE_TTL_SECONDS > 0 else None
+)
+_verified_passwords_lock = threading.Lock()
+
+# Verificaciones en curso por clave del par (single-flight): intentos idénticos
+# concurrentes esperan el mismo KDF en vez de encolar uno cada uno
+_inflight_verifications: Dict[bytes, "asyncio.Future[bool]"] = {}
+
+# Pool propio para el hashing, por defecto un hilo por núcleo: argon2-cffi y bcrypt
+# liberan el GIL durante el cálculo, así que los hilos escalan con los núcleos igual
+# que un pool de procesos, sin copiar argumentos entre procesos ni duplicar la app
+_hashing_pool = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1,
+    thread_name_prefix="password-hash"
+)
+
+
+async def run_password_hashing(func: Callable[..., T], *args) -> T:
+    """
+    Ejecuta una operación de hashing (hash o verificación) en el pool de hashing
+    
+    Argon2/bcrypt tardan decenas de milisegundos de CPU; ejecutarlo fuera del event
+    loop evita bloquear al resto de peticiones mientras se calcula. Si todos
+    los hilos están ocupados, la operación espera turno en la cola del pool.
+    
+    Args:
+        func: Función de hashing a ejecutar (ej: verify_password)
+        args: Argumentos posicionales para la función
+        
+    Returns:
+        T: Resultado de la función
+    """
+    return await asyncio.get_running_loop().run_in_executor(_hashing_pool, func, *args)
+
+
+def secrets_match(expected: Optional[str], provided: Optional[str]) -> bool:
+    """
+    Compara dos secretos (códigos, tokens) en tiempo constante
+    
+    Nunca usar == con secretos: corta en el primer carácter distinto y el
+    tiempo de respuesta filtra cuántos caracteres del prefijo son correctos.
+    
+    Args:
+        expected: Valor guardado (None si no hay ninguno vigente)
+        provided: Valor recibido en la petición
+        
+    Returns:
+        bool: True si ambos existen y coinciden
+    """
+    if expected is None or provided is None:
+        return False
+    return hmac.compare_digest(expected.encode(), provided.encode())
+
+
+def _argon2_verify(secret: str, hashed: str) -> bool:
+    """
+    Verifica un valor contra un hash Argon2 ($argon2id$...)
+    
+    Args:
+        secret: Valor en texto plano
+        hashed: Hash guardado
+        
+    Returns:
+        bool: True si coinciden, False si no
+        
+    Raises:
+        InvalidHashError: Si el hash no es Argon2 válido
+        VerificationError: Si el hash no se pudo decodificar
+    """
+    try:
+        return _argon2.verify(hashed, secret)
+    except VerifyMismatchError:
+        return False
+
+
+def _bcrypt_verify(secret: str, hashed: str) -> bool:
+    """
+    Verifica un valor contra un hash bcrypt ($2a$/$2b$/$2y$)
+    
+    Args:
+        secret: Valor en texto plano
+        hashed: Hash guardado
+        
+    Returns:
+        bool: True si coinciden; False también si el hash no es bcrypt válido
+    """
+    try:
+        return bcrypt.checkpw(secret.encode()[:_BCRYPT_MAX_BYTES], hashed.encode())
+    except ValueError:
+        return False
+
+
+def _apply_pepper(password: str) -> str:
+    """
+    Mezcla la contraseña con el pepper del servidor (HMAC-SHA256 en base64)
+    
+    El resultado tiene largo fijo (44 caracteres), por debajo del límite de
+    72 bytes de los hashes bcrypt antiguos.
+    
+    Args:
+        password: Contraseña en texto plano
+        
+    Returns:
+        str: Contraseña con pepper aplicado
+    """
+    digest = hmac.new(_PEPPER, password.encode(), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+@lru_cache(maxsize=1)
+def _dummy_password_hash() -> str:
+    """
+    Hash de una cadena aleatoria descartada, con el mismo costo (y pepper) que
+    los hashes nuevos; se calcula en el primer uso y no al importar
+    
+    Returns:
+        str: Hash ficticio
+    """
+    return get_password_hash(secrets.token_urlsafe(16))
+
+
+def _verification_key(plain_password: str, hashed_password: str) -> bytes:
+    """
+    Clave de la caché de verificaciones para un par contraseña/hash
+    
+    Args:
+        plain_password: Contraseña en texto plano
+        hashed_password: Hash de la contraseña
+        
+    Returns:
+        bytes: HMAC-SHA256 del par con la llave del proceso
+    """
+    message = hashed_password.encode() + b"\0" + plain_password.encode()
+    return hmac.new(_VERIFY_CACHE_KEY, message, hashlib.sha256).digest()
+
+
+def is_password_verification_cached(plain_password: str, hashed_password: str) -> bool:
+    """
+    Indica si el par contraseña/hash se verificó con éxito hace poco
+    
+    Es barato (un HMAC) y puede llamarse en el event loop antes de mandar
+    la verificación al pool de hashing.
+    
+    Args:
+        plain_password: Contraseña en texto plano
+        hashed_password: Hash de la contraseña
+        
+    Returns:
+        bool: True si hay un acierto vigente en la caché
+    """
+    if _verified_passwords is None:
+        return False
+    key = _verification_key(plain_password, hashed_password)
+    with _verified_passwords_lock:
+        return _verified_passwords.get(key, False)
+
+
+def _check_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verificación sin caché (con o sin pepper según el prefijo del hash)
+    
+    Los hashes Argon2 se reconocen por su prefijo; el resto se trata como bcrypt.
+    Un hash ilegible no corta antes: se verifica contra el hash ficticio, de
+    modo que todos los caminos cuestan exactamente un KDF.
+    
+    Args:
+        plain_password: Contraseña en texto plano
+        hashed_password: Hash de la contraseña
+        
+    Returns:
+        bool: True si coinciden, False si no
+    """
+    secret = plain_password
+    try:
+        if hashed_password.startswith(_PEPPER_PREFIX):
+            if _PEPPER is None:
+                # Hash creado con pepper pero el servidor no lo tiene configurado
+                raise ValueError("PASSWORD_PEPPER no configurado")
+            secret = _apply_pepper(plain_password)
+            hashed_password = hashed_password[len(_PEPPER_PREFIX):]
+        if hashed_password.startswith(_ARGON2_PREFIX):
+            return _argon2_verify(secret, hashed_password)
+        return bcrypt.checkpw(secret.encode()[:_BCRYPT_MAX_BYTES], hashed_password.encode())
+    except (ValueError, VerificationError):
+        _check_password(plain_password, _dummy_password_hash())
+        return False
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verifica si una contraseña en texto plano coincide con su hash
     
+    La comparación del hash la hace Argon2/bcrypt en tiempo constante; este wrapper
+    no debe agregar comparaciones propias con ==. Los aciertos se recuerdan
+    durante PASSWORD_VERIFY_CACHE_TTL_SECONDS.
+    
+    Args:
+        plain_password: Contraseña en texto plano
+        hashed_password: Hash de la contraseña
+        
+    Returns:
+        bool: True si coinciden, False si no
+    """
+    if _verified_passwords is None:
+        return _check_password(plain_password, hashed_password)
+    
+    key = _verification_key(plain_password, hashed_password)
+    with _verified_passwords_lock:
+        if _verified_passwords.get(key, False):
+            return True
+    
+    matches = _check_password(plain_password, hashed_password)
+    if matches:
+        with _verified_passwords_lock:
+            _verified_passwords[key] = True
+    return matches
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """
+    Indica si un hash se creó con parámetros distintos a los actuales
+    
+    Pasa con los hashes bcrypt (anteriores a Argon2id), con los Argon2 de
+    otros parámetros (ARGON2_*) o sin el pepper cuando PASSWORD_PEPPER está
+    configurado. Solo se puede rehacer tras un login exitoso, cuando se tiene
+    la contraseña.
+    
+    Args:
+        hashed_password: Hash guardado
+        
+    Returns:
+        bool: True si conviene regenerar el hash
+    """
+    peppered = hashed_password.startswith(_PEPPER_PREFIX)
+    if peppered != (_PEPPER is not None):
+        return True
+    if peppered:
+        hashed_password = hashed_password[len(_PEPPER_PREFIX):]
+    if not hashed_password.startswith(_ARGON2_PREFIX):
+        return True
+    try:
+        return _argon2.check_needs_rehash(hashed_password)
+    except InvalidHashError:
+        return True
+
+
+def _discard_inflight(key: bytes, future: "asyncio.Future[bool]") -> None:
+    """Quita una verificación terminada del registro (solo si sigue siendo la misma)"""
+    if _inflight_verifications.get(key) is future:
+        del _inflight_verifications[key]
+
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Versión asíncrona de verify_password
+    
+    Un acierto reciente se resuelve en el event loop; el resto va al pool de
+    hashing. Si el mismo par ya se está verificando (reintentos, ráfagas de
+    credential stuffing) se espera ese resultado en lugar de repetir el KDF.
+    
     Args:
         plain_password: Contraseña en texto plano
         hashed_password: Hash de la contraseña
@@ -20,12 +326,51 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     Returns:
         bool: True si coinciden, False si no
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    if is_password_verification_cached(plain_password, hashed_password):
+        return True
+    
+    loop = asyncio.get_running_loop()
+    key = _verification_key(plain_password, hashed_password)
+    future = _inflight_verifications.get(key)
+    if future is None or future.get_loop() is not loop:
+        future = loop.run_in_executor(_hashing_pool, verify_password, plain_password, hashed_password)
+        _inflight_verifications[key] = future
+        future.add_done_callback(lambda done: _discard_inflight(key, done))
+    # shield: si un cliente cancela su petición, el resto sigue esperando el mismo KDF
+    return await asyncio.shield(future)
+
+
+def verify_dummy_password(plain_password: str) -> None:
+    """
+    Ejecuta una verificación contra un hash ficticio
+    
+    Se usa cuando el usuario no existe para que la respuesta tarde lo mismo
+    que una contraseña incorrecta y no permita enumerar emails por tiempo.
+    
+    Args:
+        plain_password: Contraseña en texto plano recibida
+    """
+    _check_password(plain_password, _dummy_password_hash())
 
 
 def get_password_hash(password: str) -> str:
     """
-    Genera un hash bcrypt de una contraseña
+    Genera un hash Argon2id de una contraseña
+    
+    Args:
+        password: Contraseña en texto plano
+        
+    Returns:
+        str: Hash de la contraseña ($argon2id$...)
+    """
+    if _PEPPER is not None:
+        return _PEPPER_PREFIX + _argon2.hash(_apply_pepper(password))
+    return _argon2.hash(password)
+
+
+async def aget_password_hash(password: str) -> str:
+    """
+    Versión asíncrona de get_password_hash (se ejecuta en el pool de hashing)
     
     Args:
         password: Contraseña en texto plano
@@ -33,15 +378,16 @@ def get_password_hash(password: str) -> str:
     Returns:
         str: Hash de la contraseña
     """
-    return pwd_context.hash(password)
+    return await run_password_hashing(get_password_hash, password)
 
 
 def generate_reset_token() -> str:
     """
     Returns:
-        str: Token aleatorio seguro de 32 bytes en formato URL-safe
+        str: Token aleatorio seguro de 32 bytes en hexadecimal (64 caracteres, URL-safe)
     """
-    return secrets.token_urlsafe(32)
+    # bytes.hex() es una sola llamada en C, sin base64 ni recorte del relleno
+    return os.urandom(32).hex()
 
 
 def get_reset_token_expiration(hours: int = 1) -> datetime:
@@ -54,8 +400,7 @@ def get_reset_token_expiration(hours: int = 1) -> datetime:
     Returns:
         datetime: Fecha y hora de expiración (timezone-aware)
     """
-    from datetime import timezone
-    return datetime.now(timezone.utc) + timedelta(hours=hours)
+    return _now_utc() + timedelta(hours=hours)
 
 
 def is_reset_token_valid(token_expires: datetime) -> bool:
@@ -71,25 +416,51 @@ def is_reset_token_valid(token_expires: datetime) -> bool:
     if token_expires is None:
         return False
     
-    from datetime import timezone
-    
     # Normalizar a timezone-aware si es necesario
-    now = datetime.now(timezone.utc)
+    now = _now_utc()
     
     # Si token_expires es naive, asumir UTC
     if token_expires.tzinfo is None:
-        token_expires = token_expires.replace(tzinfo=timezone.utc)
+        token_expires = token_expires.replace(tzinfo=_UTC)
     
     return now < token_expires
 
 
+@dataclass(frozen=True, slots=True)
+class ResetToken:
+    """Token de restablecimiento junto con su fecha de expiración"""
+    token: str
+    expires: datetime
+
+
+def new_reset_token(hours: int = 1) -> ResetToken:
+    """
+    Genera un token de restablecimiento y su expiración en una sola llamada
+    
+    Args:
+        hours: Horas de validez del token (por defecto 1 hora)
+        
+    Returns:
+        ResetToken: Token y expiración (timezone-aware)
+    """
+    return ResetToken(token=generate_reset_token(), expires=get_reset_token_expiration(hours))
+
+
 def generate_reset_code() -> str:
     """
+    Genera un código numérico de 6 dígitos
+    
+    Se toman 24 bits de os.urandom y se descartan los valores >= 16_000_000
+    (el mayor múltiplo de 10^6 que cabe), así el módulo no introduce sesgo.
+    Se repite en ~4,6% de los casos.
     
     Returns:
         str: Código de 6 dígitos (ej: "123456")
     """
-    return f"{secrets.randbelow(1000000):06d}"
+    while True:
+        sample = int.from_bytes(os.urandom(3), "big")
+        if sample < _RESET_CODE_LIMIT:
+            return f"{sample % 1000000:06d}"
 
 
 def get_reset_code_expiration(minutes: int = 10) -> datetime:
@@ -102,8 +473,7 @@ def get_reset_code_expiration(minutes: int = 10) -> datetime:
     Returns:
         datetime: Fecha y hora de expiración (timezone-aware)
     """
-    from datetime import timezone
-    return datetime.now(timezone.utc) + timedelta(minutes=minutes)
+    return _now_utc() + timedelta(minutes=minutes)
 
 
 def is_reset_code_valid(code_expires: datetime) -> bool:
@@ -119,41 +489,116 @@ def is_reset_code_valid(code_expires: datetime) -> bool:
     if code_expires is None:
         return False
     
-    from datetime import timezone
-    
     # Normalizar a timezone-aware si es necesario
-    now = datetime.now(timezone.utc)
+    now = _now_utc()
     
     # Si code_expires es naive, asumir UTC
     if code_expires.tzinfo is None:
-        code_expires = code_expires.replace(tzinfo=timezone.utc)
+        code_expires = code_expires.replace(tzinfo=_UTC)
     
     return now < code_expires
 
 
-def hash_security_answer(answer: str) -> str:
+def _normalize_security_answer(answer: str) -> str:
+    """
+    Normaliza una respuesta de seguridad (sin espacios extremos, minúsculas)
+    
+    strip() va primero porque devuelve la misma cadena si no hay espacios, así
+    que en el caso común solo lower() reserva memoria. Se mantiene lower() de
+    Unicode (no un mapa ASCII ni casefold) para que "MÉXICO" siga coincidiendo
+    con los hashes ya guardados.
+    
+    Args:
+        answer: Respuesta en texto plano
+        
+    Returns:
+        str: Respuesta normalizada
+    """
+    return answer.strip().lower()
+
+
+def _security_answer_digest(answer: str, user_id: int) -> str:
+    """
+    HMAC-SHA256 (hex) de la respuesta normalizada, ligado al ID del usuario
+    
+    El ID hace de sal: dos usuarios con la misma respuesta guardan valores
+    distintos. Se usa el ID y no el email porque el email puede cambiar.
+    """
+    message = f"{user_id}:{_normalize_security_answer(answer)}".encode()
+    return hmac.new(_ANSWER_KEY, message, hashlib.sha256).hexdigest()
+
+
+def hash_security_answer(answer: str, user_id: int) -> str:
     """
-    Genera un hash de la respuesta de seguridad (similar a contraseña)
+    Genera un hash de la respuesta de seguridad
+    
+    Se usa un HMAC con llave del servidor en lugar de bcrypt: sin la llave
+    el hash no permite probar respuestas offline, y verificarlo tarda
+    microsegundos en vez de ~100 ms.
     
     Args:
         answer: Respuesta de seguridad en texto plano
+        user_id: ID del usuario dueño de la respuesta
+        
+    Returns:
+        str: Hash de la respuesta ($hmac-sha256$...)
+    """
+    return _ANSWER_HMAC_PREFIX + _security_answer_digest(answer, user_id)
+
+
+def security_answer_needs_rehash(hashed_answer: str) -> bool:
+    """
+    Indica si una respuesta guardada sigue en el formato bcrypt antiguo
+    
+    Args:
+        hashed_answer: Hash guardado
         
     Returns:
-        str: Hash de la respuesta
+        bool: True si conviene regenerarlo con hash_security_answer
     """
-    return pwd_context.hash(answer.lower().strip())
+    return not hashed_answer.startswith(_ANSWER_HMAC_PREFIX)
 
 
-def verify_security_answer(plain_answer: str, hashed_answer: str) -> bool:
+def verify_security_answer(plain_answer: str, hashed_answer: str, user_id: int) -> bool:
     """
     Verifica si una respuesta de seguridad coincide con su hash
     
+    Acepta tanto el formato HMAC actual como los hashes bcrypt antiguos.
+    
+    Args:
+        plain_answer: Respuesta en texto plano
+        hashed_answer: Hash de la respuesta
+        user_id: ID del usuario dueño de la respuesta
+        
+    Returns:
+        bool: True si coinciden, False si no
+    """
+    if security_answer_needs_rehash(hashed_answer):
+        return _bcrypt_verify(_normalize_security_answer(plain_answer), hashed_answer)
+    return hmac.compare_digest(
+        hashed_answer[len(_ANSWER_HMAC_PREFIX):].encode(),
+        _security_answer_digest(plain_answer, user_id).encode()
+    )
+
+
+async def averify_security_answer(plain_answer: str, hashed_answer: str, user_id: int) -> bool:
+    """
+    Versión asíncrona de verify_security_answer
+    
+    El HMAC se resuelve en el event loop; solo los hashes bcrypt antiguos van
+    al pool de hashing.
+    
     Args:
         plain_answer: Respuesta en texto plano
         hashed_answer: Hash de la respuesta
+        user_id: ID del usuario dueño de la respuesta
         
     Returns:
         bool: True si coinciden, False si no
     """
-    return pwd_context.verify(plain_answer.lower().strip(), hashed_answer)
+    if security_answer_needs_rehash(hashed_answer):
+        return await run_password_hashing(
+            verify_security_answer, plain_answer, hashed_answer, user_id
+        )
+    return verify_security_answer(plain_answer, hashed_answer, user_id)
 
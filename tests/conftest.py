@@ -0,0 +1,11 @@
+"""
+Configuración común de los tests
+
+Se ejecuta antes de importar src: los parámetros de Argon2 se bajan al mínimo
+para que cada hash de los tests tarde microsegundos en vez de ~100 ms.
+"""
+import os
+
+os.environ.setdefault("ARGON2_TIME_COST", "1")
+os.environ.setdefault("ARGON2_MEMORY_COST", "8")
+os.environ.setdefault("ARGON2_PARALLELISM", "1")
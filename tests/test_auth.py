@@ -1,62 +1,184 @@
 """
 Tests para el microservicio MS-AUTH-PY
 """
+import asyncio
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.pool import StaticPool
 
 from src.main import app
-from src.models import Base, get_db, User
+from src.models import Base, get_db, User, UserRole
 from src.utils import get_password_hash
 
 # Base de datos en memoria para tests
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_engine(
+engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-def override_get_db():
+# pysqlite/aiosqlite no emiten BEGIN por su cuenta: sin esto los SAVEPOINT no
+# funcionan y el rollback del test no deshace nada (receta de la doc de SQLAlchemy)
+@event.listens_for(engine.sync_engine, "connect")
+def _disable_driver_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+@event.listens_for(engine.sync_engine, "begin")
+def _emit_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
+# Las sesiones se enlazan a la conexión del test en curso; sus commit liberan un
+# SAVEPOINT y la transacción externa se revierte al terminar el test
+TestingSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, join_transaction_mode="create_savepoint"
+)
+_test_connection = {}
+
+# Hash del usuario de prueba, calculado una sola vez para toda la suite
+TEST_PASSWORD_HASH = get_password_hash("testpass123")
+
+
+def testing_session():
+    """Sesión de tests enlazada a la conexión del test en curso"""
+    # Fuera de un test (fixtures de sesión) se usa el engine directamente
+    return TestingSessionLocal(bind=_test_connection.get("conn", engine))
+
+
+async def override_get_db():
     """Override de la dependency get_db para tests"""
-    try:
-        db = TestingSessionLocal()
+    async with testing_session() as db:
         yield db
-    finally:
-        db.close()
 
 
 app.dependency_overrides[get_db] = override_get_db
+app.state.SessionLocal = testing_session
 
 client = TestClient(app)
 
 
-@pytest.fixture(autouse=True)
-def setup_database():
-    """Configurar base de datos para cada test"""
-    Base.metadata.create_all(bind=engine)
+async def _create_database():
+    """Crea las tablas y el usuario de prueba"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     
     # Crear usuario de prueba
-    db = TestingSessionLocal()
-    test_user = User(
-        name="Test User",
-        email="test@test.com",
-        password_hash=get_password_hash("testpass123"),
-        role="admin",
-        is_active=True
-    )
-    db.add(test_user)
-    db.commit()
-    db.close()
+    async with TestingSessionLocal(bind=engine) as db:
+        test_user = User(
+            name="Test User",
+            email="test@test.com",
+            password_hash=TEST_PASSWORD_HASH,
+            role=UserRole.ADMIN,
+            is_active=True
+        )
+        db.add(test_user)
+        await db.commit()
+
+
+async def _drop_database():
+    """Elimina las tablas"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+
+
+async def _begin_test_transaction():
+    """Abre la conexión del test y su transacción externa"""
+    conn = await engine.connect()
+    return conn, await conn.begin()
+
+
+async def _rollback_test_transaction(conn, transaction):
+    """Revierte todo lo que hizo el test y libera la conexión"""
+    await transaction.rollback()
+    await conn.close()
+
+
+@pytest.fixture(scope="session")
+def database_schema():
+    """Crea el esquema y el usuario de prueba una sola vez por sesión"""
+    asyncio.run(_create_database())
+    
+    yield
+    
+    asyncio.run(_drop_database())
+
+
+@pytest.fixture(autouse=True)
+def setup_database(database_schema):
+    """Aísla cada test en una transacción que se revierte al terminar"""
+    conn, transaction = asyncio.run(_begin_test_transaction())
+    _test_connection["conn"] = conn
     
     yield
     
-    Base.metadata.drop_all(bind=engine)
+    del _test_connection["conn"]
+    asyncio.run(_rollback_test_transaction(conn, transaction))
+
+
+@pytest.fixture(scope="session")
+def auth_token(database_schema):
+    """Token del usuario de prueba, obtenido con un solo login por sesión"""
+    response = client.post(
+        "/api/v1/auth/login",
+        json={
+            "email": "test@test.com",
+            "password": "testpass123"
+        }
+    )
+    return response.json()["access_token"]
+
+
+@pytest.fixture
+def auth_headers(auth_token):
+    """Cabecera Authorization con el token compartido"""
+    return {"Authorization": f"Bearer {auth_token}"}
+
+
+def register(email, name="Usuario Test", password="userpass123", role=UserRole.VENDEDOR.value):
+    """Registra un usuario con /register y devuelve la respuesta"""
+    return client.post(
+        "/api/v1/auth/register",
+        json={"name": name, "email": email, "password": password, "role": role}
+    )
+
+
+def execute_sql(statement, **params):
+    """Ejecuta SQL directo dentro de la transacción del test en curso"""
+    async def _execute():
+        async with testing_session() as db:
+            await db.execute(text(statement), params)
+            await db.commit()
+    asyncio.run(_execute())
+
+
+def fetch_one(statement, **params):
+    """Lee una fila con SQL directo dentro de la transacción del test en curso"""
+    async def _fetch():
+        async with testing_session() as db:
+            return (await db.execute(text(statement), params)).first()
+    return asyncio.run(_fetch())
+
+
+def set_security_answer(user_id, answer_hash):
+    """Configura la pregunta de seguridad de un usuario con el hash indicado"""
+    execute_sql(
+        "UPDATE users SET security_question = 'Color favorito', security_answer_hash = :hash WHERE id = :id",
+        hash=answer_hash, id=user_id
+    )
+
+
+def forgot_with_answer(email, answer):
+    """Pide el restablecimiento respondiendo la pregunta de seguridad"""
+    return client.post(
+        "/api/v1/auth/forgot-password",
+        json={"email": email, "verification_method": "security_question", "security_answer": answer}
+    )
 
 
 class TestAuth:
@@ -116,31 +238,17 @@ class TestAuth:
         response = client.get("/api/v1/auth/me")
         assert response.status_code == 401
     
-    def test_get_me_with_token(self):
+    def test_get_me_with_token(self, auth_headers):
         """Test de /me con token válido"""
-        # Primero hacer login
-        login_response = client.post(
-            "/api/v1/auth/login",
-            json={
-                "email": "test@test.com",
-                "password": "testpass123"
-            }
-        )
-        token = login_response.json()["access_token"]
-        
-        # Usar el token para obtener /me
-        response = client.get(
-            "/api/v1/auth/me",
-            headers={"Authorization": f"Bearer {token}"}
-        )
+        response = client.get("/api/v1/auth/me", headers=auth_headers)
         assert response.status_code == 200
         data = response.json()
         assert data["email"] == "test@test.com"
-        assert data["role"] == "admin"
+        assert data["role"] == UserRole.ADMIN.value
     
     def test_logout(self):
         """Test de logout"""
-        # Primero hacer login
+        # Login propio: el logout revoca el token y no debe afectar a auth_token
         login_response = client.post(
             "/api/v1/auth/login",
             json={
@@ -159,6 +267,30 @@ class TestAuth:
         data = response.json()
         assert "message" in data
     
+    def test_logout_revokes_token(self):
+        """Test de que el token deja de ser válido después del logout"""
+        client.post(
+            "/api/v1/auth/register",
+            json={
+                "name": "Logout User",
+                "email": "logout@test.com",
+                "password": "logoutpass123",
+                "role": "ADMIN"
+            }
+        )
+        login_response = client.post(
+            "/api/v1/auth/login",
+            json={
+                "email": "logout@test.com",
+                "password": "logoutpass123"
+            }
+        )
+        headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+        assert client.post("/api/v1/auth/logout", headers=headers).status_code == 200
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 401
+
     def test_register_new_user(self):
         """Test de registro de nuevo usuario"""
         response = client.post(
@@ -167,7 +299,7 @@ class TestAuth:
                 "name": "New User",
                 "email": "newuser@test.com",
                 "password": "newpass123",
-                "role": "admin"
+                "role": UserRole.ADMIN.value
             }
         )
         assert response.status_code == 201
@@ -190,6 +322,212 @@ class TestAuth:
         data = response.json()
         assert "detail" in data
     
+    def test_register_duplicate_email_other_case(self):
+        """Test de que /register rechaza un email que solo cambia en mayúsculas"""
+        assert register("u0@x.com").status_code == 201
+        
+        response = register("U0@X.com")
+        assert response.status_code == 400
+        assert response.json()["detail"] == "El email ya está registrado"
+    
+    def test_create_user_duplicate_email_other_case(self, auth_headers, monkeypatch):
+        """Test de que POST /users rechaza el duplicado sin registrar auditoría"""
+        import src.routers.users as users_router
+        
+        events = []
+        monkeypatch.setattr(users_router, "audit_event", lambda event, *args: events.append(event))
+        
+        user_data = {"name": "Usuario Uno", "role": UserRole.VENDEDOR.value, "password": "Userpass123"}
+        response = client.post(
+            "/api/v1/auth/users", json={**user_data, "email": "u1@x.com"}, headers=auth_headers
+        )
+        assert response.status_code == 201
+        assert events == ["user_created"]
+        
+        response = client.post(
+            "/api/v1/auth/users", json={**user_data, "email": "U1@X.com"}, headers=auth_headers
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "El email ya está registrado en el sistema"
+        assert events == ["user_created"]
+    
+    def test_update_user_email_conflicts(self, auth_headers):
+        """Test de que el email de otro usuario se rechaza aunque cambien las mayúsculas"""
+        register("owner@test.com")
+        user_id = register("editor@test.com").json()["id"]
+        
+        response = client.put(
+            f"/api/v1/auth/users/{user_id}", json={"email": "OWNER@test.com"}, headers=auth_headers
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "El email ya está en uso por otro usuario"
+        
+        # Cambiar solo las mayúsculas del email propio no es un duplicado
+        response = client.put(
+            f"/api/v1/auth/users/{user_id}", json={"email": "Editor@test.com"}, headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert response.json()["email"] == "Editor@test.com"
+    
+    def test_update_user_not_found(self, auth_headers):
+        """Test de actualización de un usuario inexistente"""
+        for patch in ({"name": "Nadie Aqui"}, {}):
+            response = client.put("/api/v1/auth/users/99999", json=patch, headers=auth_headers)
+            assert response.status_code == 404
+    
+    def test_update_user_empty_patch(self, auth_headers):
+        """Test de que un patch vacío o con nulos devuelve el usuario sin cambios"""
+        created = register("unchanged@test.com", name="Sin Cambios").json()
+        
+        for patch in ({}, {"name": None}):
+            response = client.put(
+                f"/api/v1/auth/users/{created['id']}", json=patch, headers=auth_headers
+            )
+            assert response.status_code == 200
+            data = response.json()
+            assert data["name"] == "Sin Cambios"
+            assert data["email"] == "unchanged@test.com"
+            assert data["role"] == created["role"]
+    
+    def test_update_user_invalidates_current_user_cache(self, auth_headers):
+        """Test de que un cambio de rol se ve en /me con el mismo token"""
+        user_id = register("rolechange@test.com").json()["id"]
+        login_response = client.post(
+            "/api/v1/auth/login",
+            json={"email": "rolechange@test.com", "password": "userpass123"}
+        )
+        headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+        assert client.get("/api/v1/auth/me", headers=headers).json()["role"] == UserRole.VENDEDOR.value
+        
+        response = client.put(
+            f"/api/v1/auth/users/{user_id}", json={"role": UserRole.TENDERO.value}, headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert client.get("/api/v1/auth/me", headers=headers).json()["role"] == UserRole.TENDERO.value
+    
+    def test_list_users_keyset_pagination(self, auth_headers):
+        """Test de paginación por cursor con la cabecera X-Next-After-Id"""
+        ids = [register(f"page{i}@test.com").json()["id"] for i in range(3)]
+        
+        # Página completa: trae el cursor de la siguiente
+        response = client.get("/api/v1/auth/users?limit=2", headers=auth_headers)
+        assert response.status_code == 200
+        first_page = [user["id"] for user in response.json()]
+        assert len(first_page) == 2
+        assert response.headers["X-Next-After-Id"] == str(first_page[-1])
+        
+        # Página corta: sin cursor
+        response = client.get(
+            f"/api/v1/auth/users?limit=10&after_id={first_page[-1]}", headers=auth_headers
+        )
+        assert [user["id"] for user in response.json()] == [i for i in ids if i > first_page[-1]]
+        assert "X-Next-After-Id" not in response.headers
+        
+        # Después del último ID no hay más usuarios
+        response = client.get(f"/api/v1/auth/users?after_id={ids[-1]}", headers=auth_headers)
+        assert response.json() == []
+        assert "X-Next-After-Id" not in response.headers
+    
+    def test_list_users_skip_with_after_id(self, auth_headers):
+        """Test de que skip se aplica después del cursor after_id"""
+        ids = [register(f"skip{i}@test.com").json()["id"] for i in range(3)]
+        
+        response = client.get(
+            f"/api/v1/auth/users?after_id={ids[0]}&skip=1", headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert [user["id"] for user in response.json()] == ids[2:]
+    
+    def test_list_users_omits_null_created_at(self, auth_headers):
+        """Test de que created_at se omite (no se envía null) si no tiene valor"""
+        user_id = register("nodate@test.com").json()["id"]
+        execute_sql("UPDATE users SET created_at = NULL WHERE id = :id", id=user_id)
+        
+        users = {user["email"]: user for user in client.get("/api/v1/auth/users", headers=auth_headers).json()}
+        assert users["nodate@test.com"]["id"] == user_id
+        assert "created_at" not in users["nodate@test.com"]
+        assert users["test@test.com"]["created_at"] is not None
+    
+    def test_forgot_password_code_is_single_use(self):
+        """Test de que el código de 6 dígitos restablece la contraseña una sola vez"""
+        register("forgot@test.com")
+        response = client.post("/api/v1/auth/forgot-password", json={"email": "forgot@test.com"})
+        assert response.status_code == 200
+        assert response.json()["reset_code"] is None  # El código nunca viaja en la respuesta
+        
+        reset_code = fetch_one(
+            "SELECT reset_code FROM users WHERE email = 'forgot@test.com'"
+        ).reset_code
+        reset_request = {"email": "forgot@test.com", "reset_code": reset_code, "new_password": "newpass456"}
+        assert client.post("/api/v1/auth/reset-password", json=reset_request).status_code == 200
+        
+        # El mismo UPDATE que cambia la contraseña consume el código
+        assert fetch_one(
+            "SELECT reset_code, reset_code_expires FROM users WHERE email = 'forgot@test.com'"
+        ) == (None, None)
+        response = client.post("/api/v1/auth/reset-password", json=reset_request)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Código de verificación inválido"
+        
+        login_response = client.post(
+            "/api/v1/auth/login", json={"email": "forgot@test.com", "password": "newpass456"}
+        )
+        assert login_response.status_code == 200
+    
+    def test_forgot_password_token_is_single_use(self):
+        """Test de que el token de la pregunta de seguridad se consume al usarlo"""
+        from src.utils import hash_security_answer
+        
+        user_id = register("token@test.com").json()["id"]
+        set_security_answer(user_id, hash_security_answer("Azul", user_id))
+        assert forgot_with_answer("token@test.com", "azul").status_code == 200
+        
+        token = fetch_one("SELECT reset_token FROM users WHERE id = :id", id=user_id).reset_token
+        reset_request = {"email": "token@test.com", "token": token, "new_password": "newpass456"}
+        assert client.post("/api/v1/auth/reset-password", json=reset_request).status_code == 200
+        
+        response = client.post("/api/v1/auth/reset-password", json=reset_request)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Token de restablecimiento inválido"
+    
+    def test_forgot_password_migrates_legacy_answer(self):
+        """Test de que una respuesta bcrypt antigua verifica y se reescribe como HMAC"""
+        import bcrypt
+        from src.utils import hash_security_answer
+        
+        user_id = register("legacy@test.com").json()["id"]
+        set_security_answer(user_id, bcrypt.hashpw(b"azul", bcrypt.gensalt(rounds=4)).decode())
+        
+        assert forgot_with_answer("legacy@test.com", "rojo").status_code == 401
+        
+        assert forgot_with_answer("legacy@test.com", " Azul ").status_code == 200
+        row = fetch_one(
+            "SELECT security_answer_hash, reset_token FROM users WHERE id = :id", id=user_id
+        )
+        assert row.security_answer_hash == hash_security_answer("azul", user_id)
+        assert row.security_answer_hash.startswith("$hmac-sha256$")
+        assert row.reset_token is not None
+        
+        # Ya migrada, la respuesta sigue verificando
+        assert forgot_with_answer("legacy@test.com", "azul").status_code == 200
+    
+    def test_security_answer_hash_is_per_user(self):
+        """Test de que la misma respuesta guarda valores distintos en cada usuario"""
+        from src.utils import hash_security_answer
+        
+        first_id = register("answer1@test.com").json()["id"]
+        second_id = register("answer2@test.com").json()["id"]
+        first_hash = hash_security_answer("Azul", first_id)
+        assert hash_security_answer("Azul", second_id) != first_hash
+        
+        # El hash de un usuario no sirve copiado en otro
+        set_security_answer(first_id, first_hash)
+        set_security_answer(second_id, first_hash)
+        assert forgot_with_answer("answer1@test.com", "azul").status_code == 200
+        response = forgot_with_answer("answer2@test.com", "azul")
+        assert response.status_code == 401
+        assert response.json()["detail"] == "La respuesta a la pregunta de seguridad es incorrecta"
+    
     def test_root_redirect(self):
         """Test de redirección de raíz"""
         response = client.get("/", follow_redirects=False)
@@ -214,6 +552,53 @@ class TestSecurity:
         assert verify_password(password, hashed) is True
         assert verify_password("wrongpassword", hashed) is False
     
+    def test_legacy_bcrypt_password(self):
+        """Test de que los hashes bcrypt antiguos verifican y se marcan para migrar"""
+        import bcrypt
+        from src.utils import get_password_hash, verify_password, password_needs_rehash
+
+        legacy = bcrypt.hashpw(b"legacypass123", bcrypt.gensalt(rounds=4)).decode()
+        assert verify_password("legacypass123", legacy) is True
+        assert verify_password("wrongpassword", legacy) is False
+        assert password_needs_rehash(legacy) is True
+
+        hashed = get_password_hash("legacypass123")
+        assert hashed.startswith("$argon2id$")
+        assert password_needs_rehash(hashed) is False
+
+    def test_password_verification_cache(self):
+        """Test de que solo se recuerdan las verificaciones exitosas"""
+        from src.utils import get_password_hash, verify_password, is_password_verification_cached
+
+        hashed = get_password_hash("cachedpass123")
+        assert is_password_verification_cached("cachedpass123", hashed) is False
+
+        assert verify_password("cachedpass123", hashed) is True
+        assert is_password_verification_cached("cachedpass123", hashed) is True
+
+        # Una contraseña incorrecta nunca queda en caché
+        assert verify_password("wrongpassword", hashed) is False
+        assert is_password_verification_cached("wrongpassword", hashed) is False
+
+    def test_security_answer_hashing(self):
+        """Test de respuestas de seguridad con HMAC y con hashes bcrypt antiguos"""
+        from src.utils import hash_security_answer, verify_security_answer, security_answer_needs_rehash
+        import bcrypt
+
+        hashed = hash_security_answer("Azul", 1)
+        assert security_answer_needs_rehash(hashed) is False
+        assert verify_security_answer(" azul ", hashed, 1) is True
+        assert verify_security_answer("rojo", hashed, 1) is False
+
+        # El hash depende del usuario: la misma respuesta no coincide entre cuentas
+        assert hash_security_answer("Azul", 2) != hashed
+        assert verify_security_answer("azul", hashed, 2) is False
+
+        legacy = bcrypt.hashpw(b"azul", bcrypt.gensalt(rounds=4)).decode()
+        assert security_answer_needs_rehash(legacy) is True
+        assert verify_security_answer("AZUL", legacy, 1) is True
+        assert verify_security_answer("rojo", legacy, 1) is False
+
     def test_jwt_token_structure(self):
         """Test de estructura del token JWT"""
         from src.utils import create_access_token, decode_token
@@ -229,6 +614,18 @@ class TestSecurity:
         assert decoded.email == "test@test.com"
         assert decoded.role == "admin"
 
+    def test_temporary_password_character_classes(self):
+        """Test de que la contraseña temporal incluye todos los tipos de carácter"""
+        from src.routers.users import generate_temporary_password
+
+        for _ in range(200):
+            password = generate_temporary_password()
+            assert len(password) == 12
+            assert any(c.isupper() for c in password)
+            assert any(c.islower() for c in password)
+            assert any(c.isdigit() for c in password)
+            assert any(c in "!@#$%^&*" for c in password)
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])